@@ -0,0 +1,136 @@
+import sys
+import threading
+
+from instrumentation import Instrumentation
+from resultcache import analysisKey, fingerprint
+
+
+class ArtifactCache():
+    """ Memoizes the StudyRegion getters for the lifetime of one export job
+
+        The cache stands in for the study region: the memoized getters return the frame fetched the first
+        time they were called, and every other attribute is read from the wrapped StudyRegion. Getter
+        errors are memoized as well, so a layer that is not available is only queried once. With a
+        ResultCache the getters are served from disk when the analysis has not changed since they were
+        last stored.
+
+        Keyword Arguments: \n
+            studyRegion: StudyRegion -- an initialized hazpy StudyRegion
+            resultCache: ResultCache -- optional on-disk cache shared across jobs
+            instrumentation: Instrumentation -- records a 'query' span for every fetch
+    """
+
+    cachedGetters = [
+        'getResults',
+        'getEssentialFacilities',
+        'getHazardGeoDataFrame',
+        'getBuildingDamageByOccupancy',
+        'getBuildingDamageByType'
+    ]
+
+    def __init__(self, studyRegion, resultCache=None, instrumentation=None):
+        self.studyRegion = studyRegion
+        self.resultCache = resultCache
+        self.instrumentation = instrumentation or Instrumentation()
+        self._artifacts = {}
+        self._keyLocks = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the cache itself
+        if name.startswith('_') or name in ['studyRegion', 'resultCache', 'instrumentation']:
+            raise AttributeError(name)
+        if name in self.cachedGetters:
+            getter = getattr(self.studyRegion, name)
+            return lambda: self.fetch(name, getter, persist=True)
+        return getattr(self.studyRegion, name)
+
+    def fetch(self, key, getter, persist=False):
+        """ returns the artifact stored under key, calling getter the first time it is requested
+
+            Concurrent requests for the same key wait for the first fetch instead of querying again.
+
+            Keyword Arguments: \n
+                key: str -- the artifact name
+                getter: function -- a function with no arguments that returns the artifact
+                persist: bool -- read and store the artifact in the on-disk result cache
+            Returns:
+                artifact: the value returned by getter
+        """
+        with self._lock:
+            keyLock = self._keyLocks.setdefault(key, threading.Lock())
+        with keyLock:
+            if key not in self._artifacts:
+                try:
+                    with self.instrumentation.span(key, 'query', source='database'):
+                        if persist:
+                            artifact = self.fetchPersistent(key, getter)
+                        else:
+                            artifact = getter()
+                        if hasattr(artifact, '__len__') and not isinstance(artifact, (str, dict)):
+                            self.instrumentation.annotate(rows=len(artifact))
+                    self._artifacts[key] = (True, artifact)
+                except:
+                    self._artifacts[key] = (False, sys.exc_info()[1])
+            succeeded, artifact = self._artifacts[key]
+        if not succeeded:
+            raise artifact
+        return artifact
+
+    def fetchPersistent(self, key, getter):
+        """ serves an artifact from the on-disk result cache, querying and storing it on a miss """
+        analysisKey = None
+        if self.resultCache is not None and self.resultCache.enabled:
+            analysisKey = self.fetch('_analysisKey', self.validateResultCache)
+        if analysisKey is None:
+            return getter()
+        cached = self.resultCache.load(analysisKey, key)
+        if cached is not None:
+            self.instrumentation.annotate(source='resultCache')
+            from hazpy.legacy import StudyRegionDataFrame
+            return StudyRegionDataFrame(self.studyRegion, cached)
+        artifact = getter()
+        self.resultCache.save(analysisKey, key, artifact)
+        return artifact
+
+    def validateResultCache(self):
+        """ fingerprints the study region once per job and drops stale cache entries
+
+            Returns:
+                analysisKey: dict -- the result cache key of the analysis, or None if it cannot be fingerprinted
+        """
+        try:
+            key = self.resultCache.analysisKey(self.studyRegion)
+            self.resultCache.validate(key, self.sourceFingerprint())
+            return key
+        except:
+            print('Unable to fingerprint the study region - the result cache is skipped: ' + str(sys.exc_info()[0]))
+            return None
+
+    def sourceFingerprint(self):
+        """ returns the fingerprint of the study region database, queried once per job """
+        return self.fetch('_fingerprint', lambda: fingerprint(self.studyRegion))
+
+    def sourceKey(self):
+        """ Identifies the data every export artifact is built from
+
+            Returns:
+                source: dict -- the analysis and the database fingerprint, or None if the study region cannot be fingerprinted
+        """
+        try:
+            source = analysisKey(self.studyRegion)
+            source['fingerprint'] = self.sourceFingerprint()
+            return source
+        except:
+            print('Unable to fingerprint the study region - every file is exported: ' + str(sys.exc_info()[0]))
+            return None
+
+    def has(self, key):
+        """ returns True if the artifact was fetched successfully """
+        return key in self._artifacts and self._artifacts[key][0]
+
+    def clear(self):
+        """ drops every cached artifact """
+        with self._lock:
+            self._artifacts = {}
+            self._keyLocks = {}
@@ -0,0 +1,275 @@
+""" Headless batch exporter - runs the export tool pipeline for many study regions without the GUI
+
+    Run from the tool folder so src/config.json is found, for example:
+
+        python Python_env/batchexport.py --study-regions "HU_*" Irma_2017 --output C:/exports --summary C:/exports/summary.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from connectionpool import ConnectionPools, pooledClass
+from exportjob import ExportJob
+from reportbuilder import ReportBuilder
+from resultcache import ResultCache
+
+
+def isPattern(value):
+    return any(character in value for character in '*?[')
+
+
+def matchValues(available, patterns):
+    """ Filters values with a list of names or glob patterns
+
+        Keyword Arguments: \n
+            available: list -- the values to filter
+            patterns: list -- names or glob patterns; None keeps only the default (None)
+        Returns:
+            matches: list -- the matching values in their original order
+    """
+    if patterns is None:
+        return [None]
+    return [x for x in available if any(fnmatch.fnmatch(str(x), str(pattern)) for pattern in patterns)]
+
+
+def resolveStudyRegions(patterns, createHazusDB):
+    """ expands glob patterns against the study regions in the local Hazus database """
+    if not any(isPattern(pattern) for pattern in patterns):
+        return list(patterns)
+    studyRegions = createHazusDB().getStudyRegions()
+    if hasattr(studyRegions, 'columns'):
+        studyRegions = list(studyRegions['name'])
+    names = [x for x in patterns if not isPattern(x)]
+    for name in matchValues(studyRegions, [x for x in patterns if isPattern(x)]):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def planAnalyses(name, createStudyRegion, hazards=None, scenarios=None, returnPeriods=None):
+    """ Lists the hazard, scenario, and return period combinations of a study region to export
+
+        A None filter keeps the study region default, as the GUI does when only one option exists.
+
+        Returns:
+            analyses: list -- (hazard, scenario, returnPeriod) tuples
+    """
+    studyRegion = createStudyRegion(name)
+    analyses = []
+    hazardList = matchValues(studyRegion.getHazardsAnalyzed(), hazards) if hazards is not None else [None]
+    for hazard in hazardList:
+        if hazard is not None:
+            studyRegion.setHazard(hazard)
+        scenarioList = matchValues(studyRegion.getScenarios(), scenarios) if scenarios is not None else [None]
+        for scenario in scenarioList:
+            if scenario is not None:
+                studyRegion.setScenario(scenario)
+            returnPeriodList = matchValues(studyRegion.getReturnPeriods(), returnPeriods) if returnPeriods is not None else [None]
+            for returnPeriod in returnPeriodList:
+                analyses.append((hazard, scenario, returnPeriod))
+    return analyses
+
+
+def analysisOutputPath(outputDirectory, name, analysis, analysesCount):
+    """ returns the output folder of an analysis - the study region name, plus the analysis if the region has several """
+    if analysesCount == 1:
+        return outputDirectory + '/' + name
+    folder = '_'.join([str(x) for x in analysis if x is not None]) or 'default'
+    return outputDirectory + '/' + name + '/' + re.sub(r'[^\w\-. ]', '_', folder)
+
+
+def exportAnalysis(name, analysis, outputPath, exportOptions, createStudyRegion, jobOptions=None, reportTitle='', reportSubtitle=''):
+    """ Runs one export job to completion on the calling thread
+
+        Keyword Arguments: \n
+            jobOptions: dict -- optional ExportJob keyword arguments (workers, resultCache, csvProgressRows, ...)
+        Returns:
+            summary: dict -- the analysis, status, timings, warnings, and errors of the job
+    """
+    hazard, scenario, returnPeriod = analysis
+    summary = {
+        'studyRegion': name,
+        'hazard': hazard,
+        'scenario': scenario,
+        'returnPeriod': returnPeriod,
+        'outputPath': outputPath,
+        'status': 'failed',
+        'elapsedTime': None,
+        'timings': {},
+        'warnings': [],
+        'errors': []
+    }
+    t0 = time()
+    # the stage running when an exception is raised, reported with it
+    stage = 'initialize the study region'
+    try:
+        studyRegion = createStudyRegion(name)
+        stage = 'set the hazard, scenario, and return period'
+        if hazard is not None:
+            studyRegion.setHazard(hazard)
+        if scenario is not None:
+            studyRegion.setScenario(scenario)
+        if returnPeriod is not None:
+            studyRegion.setReturnPeriod(returnPeriod)
+
+        stage = 'create the export job'
+        job = ExportJob(studyRegion, outputPath, exportOptions, reportTitle, reportSubtitle, **(jobOptions or {}))
+        stage = 'run the export job'
+        job.run()
+        stage = 'collect the export job results'
+        while not job.events.empty():
+            kind, payload = job.events.get()
+            if kind == 'warning':
+                summary['warnings'].append(payload)
+            elif kind == 'error':
+                summary['errors'].append(payload)
+            elif kind == 'failed':
+                summary['errors'].append('The export job failed: ' + str(payload))
+            elif kind in ['complete', 'cancelled']:
+                summary['status'] = kind
+        summary['timings'] = job.timings
+        summary['skipped'] = job.skipped
+        summary['spans'] = job.instrumentation.spans
+        summary['csv'] = list(job.csvStats.values())
+    except:
+        errorType, error = sys.exc_info()[0:2]
+        summary['errors'].append('Unable to {s}: {t}: {e}'.format(s=stage, t=errorType.__name__, e=error))
+    summary['elapsedTime'] = time() - t0
+    status = summary['status'] if len(summary['errors']) == 0 else summary['status'] + ' with errors'
+    print('{s} {a}: {st} in {t:.1f}s'.format(s=name, a=[x for x in analysis if x is not None], st=status, t=summary['elapsedTime']))
+    return summary
+
+
+def runBatch(studyRegions, outputDirectory, exportOptions, hazards=None, scenarios=None, returnPeriods=None,
+             workers=2, jobOptions=None, summaryPath=None, createStudyRegion=None, createHazusDB=None):
+    """ Exports many study regions with a bounded pool of concurrent export jobs
+
+        Keyword Arguments: \n
+            studyRegions: list -- study region names or glob patterns (example: ['HU_*', 'Irma_2017'])
+            outputDirectory: str -- each analysis is written to a folder named after its study region in this directory
+            exportOptions: dict -- the export options (csv, shapefile, geojson, parquet, geopackage, vectortiles, geotiff, report) as in the GUI
+            hazards: list -- optional hazard names or patterns; the study region default is used if None
+            scenarios: list -- optional scenario names or patterns; the study region default is used if None
+            returnPeriods: list -- optional return periods or patterns; the study region default is used if None
+            workers: int -- the number of export jobs that run at the same time
+            jobOptions: dict -- optional ExportJob keyword arguments shared by every job (workers, resultCache, csvProgressRows, ...)
+            summaryPath: str -- optional path of the JSON summary file
+            createStudyRegion: function -- creates a StudyRegion from a name (default: hazpy.legacy.StudyRegion)
+            createHazusDB: function -- creates a HazusDB (default: hazpy.legacy.HazusDB)
+        Returns:
+            summary: dict -- the timings and failures of every export job
+    """
+    if createStudyRegion is None or createHazusDB is None:
+        from hazpy.legacy import StudyRegion, HazusDB
+        createStudyRegion = createStudyRegion or StudyRegion
+        createHazusDB = createHazusDB or HazusDB
+
+    t0 = time()
+    summary = {'started': t0, 'elapsedTime': None, 'jobs': [], 'failed': 0, 'planningErrors': []}
+    if not os.path.exists(outputDirectory):
+        os.makedirs(outputDirectory)
+
+    # plan every analysis first so the jobs can be spread over the pool
+    tasks = []
+    for name in resolveStudyRegions(studyRegions, createHazusDB):
+        try:
+            analyses = planAnalyses(name, createStudyRegion, hazards, scenarios, returnPeriods)
+        except:
+            summary['planningErrors'].append({'studyRegion': name, 'error': str(sys.exc_info()[1])})
+            print('Unable to read the analyses of ' + name + ': ' + str(sys.exc_info()[1]))
+            continue
+        for analysis in analyses:
+            tasks.append((name, analysis, analysisOutputPath(outputDirectory, name, analysis, len(analyses))))
+    print('Exporting {n} analyses with {w} workers'.format(n=len(tasks), w=workers))
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='BatchExport') as executor:
+        futures = [executor.submit(exportAnalysis, name, analysis, outputPath, exportOptions, createStudyRegion,
+                                   jobOptions) for name, analysis, outputPath in tasks]
+        summary['jobs'] = [future.result() for future in futures]
+
+    summary['failed'] = len([job for job in summary['jobs'] if job['status'] != 'complete' or len(job['errors']) > 0]) + \
+        len(summary['planningErrors'])
+    summary['elapsedTime'] = time() - t0
+    if summaryPath is not None:
+        with open(summaryPath, 'w') as summaryFile:
+            json.dump(summary, summaryFile, indent=2, default=str)
+    print('Total elapsed time: ' + str(summary['elapsedTime']))
+    return summary
+
+
+def jobOptionsFromConfig(config):
+    """ returns the ExportJob keyword arguments set in the export section of src/config.json """
+    exportConfig = config['export']
+    return {
+        'workers': exportConfig['writerWorkers'],
+        'resultCache': ResultCache(exportConfig['resultCacheDirectory'], enabled=exportConfig['resultCache']),
+        'csvProgressRows': exportConfig['csvProgressRows'],
+        'csvGzip': exportConfig['csvGzip'],
+        'parquetCompression': exportConfig['parquetCompression'],
+        'tableFormat': exportConfig['tableFormat'],
+        'geopackageBatchSize': exportConfig['geopackageBatchSize'],
+        'incremental': exportConfig['incremental'],
+        'reportBuilder': ReportBuilder(config['report']['cacheDirectory'], config['report']['draftDpi'],
+                                       config[config['release']]['httpTimeout']),
+        'spanLog': config['instrumentation']['spanLog'],
+        'profileDirectory': config['instrumentation']['profileDirectory'],
+        'traceMemory': config['instrumentation']['traceMemory'],
+        'progressHistory': exportConfig['progressHistory'],
+        'geometryPrecision': exportConfig['geometryPrecision'],
+        'simplifyTolerance': exportConfig['simplifyTolerance'],
+        'levelsOfDetail': exportConfig['levelsOfDetail'],
+        'vectorTiles': exportConfig['vectorTiles'],
+        'hazardRaster': exportConfig['hazardRaster']
+    }
+
+
+def main(args=None):
+    config = json.loads(open('src/config.json').read())
+    parser = argparse.ArgumentParser(description='Exports Hazus results for many study regions without the GUI.')
+    parser.add_argument('--study-regions', nargs='+', required=True, help='study region names or glob patterns')
+    parser.add_argument('--output', required=True, help='the output directory')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'shapefile', 'geojson', 'report'],
+                        choices=['csv', 'shapefile', 'geojson', 'parquet', 'geopackage', 'vectortiles', 'geotiff', 'report'], help='the output formats')
+    parser.add_argument('--hazards', nargs='+', help='hazard names or glob patterns (default: the study region default)')
+    parser.add_argument('--scenarios', nargs='+', help='scenario names or glob patterns (default: the study region default)')
+    parser.add_argument('--return-periods', nargs='+', help='return periods or glob patterns (default: the study region default)')
+    parser.add_argument('--workers', type=int, default=2, help='the number of export jobs that run at the same time')
+    parser.add_argument('--summary', help='path of the JSON summary of timings and failures')
+    parser.add_argument('--gzip-csv', action='store_true', help='gzip the CSV outputs')
+    parser.add_argument('--draft-report', type=int, nargs='?', const=150, metavar='DPI',
+                        help='render the report images at a low resolution (default: 150 dpi)')
+    parser.add_argument('--profile', metavar='DIRECTORY', help='write a cProfile dump of every export job to this directory')
+    parser.add_argument('--force', action='store_true', help='rewrite every file, even if it is unchanged since the last export')
+    args = parser.parse_args(args)
+
+    exportOptions = {x: int(x in args.formats) for x in ['csv', 'shapefile', 'geojson', 'parquet', 'geopackage', 'vectortiles', 'geotiff', 'report']}
+    # the concurrent jobs lease their database connections from a pool per class and database
+    from hazpy.legacy import StudyRegion, HazusDB
+    connectionPools = ConnectionPools(**config['database'])
+    createStudyRegion = pooledClass(StudyRegion, connectionPools)
+    createHazusDB = pooledClass(HazusDB, connectionPools)
+    jobOptions = jobOptionsFromConfig(config)
+    if args.gzip_csv:
+        jobOptions['csvGzip'] = True
+    if args.force:
+        jobOptions['incremental'] = False
+    if args.profile is not None:
+        jobOptions['profileDirectory'] = args.profile
+    if args.draft_report is not None:
+        jobOptions['reportBuilder'].draftDpi = args.draft_report
+    try:
+        summary = runBatch(args.study_regions, args.output, exportOptions, args.hazards, args.scenarios, args.return_periods,
+                           workers=args.workers, jobOptions=jobOptions, summaryPath=args.summary,
+                           createStudyRegion=createStudyRegion, createHazusDB=createHazusDB)
+    finally:
+        connectionPools.close()
+    return 1 if summary['failed'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
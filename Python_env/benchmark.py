@@ -0,0 +1,220 @@
+""" Export benchmarks - times every export path and the email builder against synthetic study regions and
+    compares the timings with stored baselines
+
+    Run from the tool folder so src/config.json is found. Record a baseline on a machine before a change,
+    then run the same benchmarks after it:
+
+        python Python_env/benchmark.py --sizes small medium --save-baseline
+        python Python_env/benchmark.py --sizes small medium
+
+    The exit code is 1 if any benchmark is slower than its baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from statistics import median
+from time import time
+
+from exportjob import ExportJob
+from syntheticregion import SyntheticStudyRegion
+
+# synthetic study region sizes - the county count drives the email builder
+sizes = {
+    'small': {'tracts': 500, 'facilities': 100, 'hazardPolygons': 200, 'states': 2, 'countiesPerState': 20},
+    'medium': {'tracts': 5000, 'facilities': 1000, 'hazardPolygons': 2000, 'states': 5, 'countiesPerState': 60},
+    'large': {'tracts': 50000, 'facilities': 5000, 'hazardPolygons': 20000, 'states': 10, 'countiesPerState': 100}
+}
+hazards = ['earthquake', 'flood', 'hurricane', 'tsunami']
+exportPaths = ['csv', 'shapefile', 'geojson', 'parquet', 'geopackage']
+# the draft email only summarizes hurricane losses
+emailHazards = ['hurricane']
+
+
+def benchmarkKey(hazard, size, path):
+    return '/'.join([hazard, size, path])
+
+
+def timeExport(studyRegion, exportPath, outputDirectory):
+    """ Runs an export job that writes one export path on the calling thread
+
+        The result cache and the incremental manifest are off, so every run fetches and writes everything.
+
+        Keyword Arguments: \n
+            studyRegion: SyntheticStudyRegion -- the study region to export
+            exportPath: str -- the export option to time (example: 'geopackage')
+            outputDirectory: str -- the job output directory, removed first
+        Returns:
+            seconds: float -- the job duration
+            stages: dict -- the seconds spent in each stage (fetch, query, write)
+    """
+    if os.path.exists(outputDirectory):
+        shutil.rmtree(outputDirectory)
+    exportOptions = {x: int(x == exportPath) for x in exportPaths}
+    job = ExportJob(studyRegion, outputDirectory, exportOptions, workers=1, incremental=False)
+    t0 = time()
+    job.run()
+    seconds = time() - t0
+    errors = []
+    while not job.events.empty():
+        kind, payload = job.events.get()
+        if kind in ['error', 'failed']:
+            errors.append(str(payload))
+    if len(errors) > 0:
+        raise RuntimeError('; '.join(errors))
+    stages = {}
+    for span in job.instrumentation.spans:
+        # nested query spans are already counted in the fetch span around them
+        if span['stage'] in ['fetch', 'write']:
+            stages[span['stage']] = stages.get(span['stage'], 0) + span['seconds']
+    return seconds, stages
+
+
+def timeEmail(studyRegion):
+    """ times the county rollup and HTML rendering of the draft email - Outlook is not called """
+    from draftemail import renderSummaryHTML, summarizeByCounty
+    countySummary = studyRegion.getCountySummary()
+    t0 = time()
+    states, topCounties = summarizeByCounty(countySummary)
+    renderSummaryHTML(states, topCounties)
+    return time() - t0, {}
+
+
+def runBenchmarks(hazardList, sizeList, pathList, repeat=3, seed=0, warmup=1):
+    """ Times every combination of hazard, size, and export path
+
+        Keyword Arguments: \n
+            hazardList: list -- the hazards to generate study regions for
+            sizeList: list -- the sizes of the study regions (choices: 'small', 'medium', 'large')
+            pathList: list -- the export paths, plus 'email' for the draft email builder
+            repeat: int -- the number of runs; the median is reported
+            seed: int -- the random seed of the synthetic study regions
+            warmup: int -- untimed runs first, so imports and first-call setup are not counted
+        Returns:
+            results: dict -- the median and fastest seconds and the stage medians of each benchmark
+    """
+    results = {}
+    workDirectory = tempfile.mkdtemp(prefix='hazus-benchmark-')
+    try:
+        for hazard in hazardList:
+            for size in sizeList:
+                studyRegion = SyntheticStudyRegion(hazard, seed=seed, **sizes[size])
+                for path in pathList:
+                    if path == 'email' and hazard not in emailHazards:
+                        continue
+                    key = benchmarkKey(hazard, size, path)
+                    runs = []
+                    try:
+                        for _ in range(warmup + repeat):
+                            if path == 'email':
+                                runs.append(timeEmail(studyRegion))
+                            else:
+                                runs.append(timeExport(studyRegion, path, os.path.join(workDirectory, studyRegion.name)))
+                    except:
+                        results[key] = {'error': str(sys.exc_info()[1])}
+                        print('{k}: failed - {e}'.format(k=key, e=results[key]['error']))
+                        continue
+                    runs = runs[warmup:]
+                    seconds = [x[0] for x in runs]
+                    stageNames = set(stage for x in runs for stage in x[1])
+                    results[key] = {
+                        'seconds': median(seconds),
+                        'fastest': min(seconds),
+                        'stages': {stage: median([x[1].get(stage, 0) for x in runs]) for stage in sorted(stageNames)}
+                    }
+                    print('{k}: {s:.3f}s'.format(k=key, s=results[key]['seconds']))
+    finally:
+        shutil.rmtree(workDirectory, ignore_errors=True)
+    return results
+
+
+def compareBaseline(results, baseline, tolerance=0.25, minimumSeconds=0.05):
+    """ Lists the benchmarks slower than their baseline
+
+        A benchmark regresses when its median is more than the tolerance slower than the baseline median
+        and at least minimumSeconds slower, so timer noise on very short benchmarks is not reported.
+
+        Keyword Arguments: \n
+            results: dict -- the runBenchmarks() results
+            baseline: dict -- the baseline results of the same keys
+            tolerance: float -- the allowed slowdown (example: 0.25 allows 25% slower)
+            minimumSeconds: float -- the smallest slowdown reported
+        Returns:
+            regressions: list -- (key, baseline seconds, seconds) tuples
+    """
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key, {}).get('seconds')
+        if expected is None or 'seconds' not in result:
+            continue
+        if result['seconds'] > expected * (1 + tolerance) and result['seconds'] - expected >= minimumSeconds:
+            regressions.append((key, expected, result['seconds']))
+    return regressions
+
+
+def readBaseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as baselineFile:
+        return json.load(baselineFile)
+
+
+def saveBaseline(path, results):
+    """ merges the results into the baseline file, keeping the baselines of benchmarks that were not run """
+    baseline = readBaseline(path) or {'results': {}}
+    baseline['machine'] = platform.node()
+    baseline['python'] = platform.python_version()
+    baseline['saved'] = time()
+    baseline['results'].update({key: result for key, result in results.items() if 'seconds' in result})
+    if os.path.dirname(path) != '':
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as baselineFile:
+        json.dump(baseline, baselineFile, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def main(args=None):
+    config = json.loads(open('src/config.json').read())
+    parser = argparse.ArgumentParser(description='Times the export paths against synthetic study regions.')
+    parser.add_argument('--hazards', nargs='+', default=hazards, choices=hazards, help='the hazards to benchmark')
+    parser.add_argument('--sizes', nargs='+', default=['small'], choices=list(sizes.keys()), help='the study region sizes')
+    parser.add_argument('--paths', nargs='+', default=exportPaths + ['email'], choices=exportPaths + ['email'],
+                        help='the export paths to time')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of runs of each benchmark; the median is compared')
+    parser.add_argument('--warmup', type=int, default=1, help='the number of untimed runs before each benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed of the synthetic study regions')
+    parser.add_argument('--baseline', default=config['benchmark']['baseline'], help='the baseline file')
+    parser.add_argument('--tolerance', type=float, default=config['benchmark']['tolerance'],
+                        help='the allowed slowdown before a benchmark is reported as a regression (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the timings as the new baseline')
+    parser.add_argument('--output', help='optional path of the JSON results')
+    args = parser.parse_args(args)
+
+    results = runBenchmarks(args.hazards, args.sizes, args.paths, args.repeat, args.seed, args.warmup)
+    if args.output is not None:
+        with open(args.output, 'w') as outputFile:
+            json.dump(results, outputFile, indent=2)
+    failed = len([x for x in results.values() if 'error' in x])
+    if args.save_baseline:
+        saveBaseline(args.baseline, results)
+        print('Saved the baseline to ' + args.baseline)
+        return 1 if failed > 0 else 0
+
+    baseline = readBaseline(args.baseline)
+    if baseline is None:
+        print('No baseline at ' + args.baseline + ' - run with --save-baseline first')
+        return 1 if failed > 0 else 0
+    if baseline.get('machine') != platform.node():
+        print('Warning: the baseline was recorded on ' + str(baseline.get('machine')) + ' - timings from other machines are not comparable')
+    regressions = compareBaseline(results, baseline['results'], args.tolerance)
+    for key, expected, seconds in regressions:
+        print('Regression {k}: {s:.3f}s, baseline {b:.3f}s (+{p:.0%})'.format(k=key, s=seconds, b=expected, p=seconds / expected - 1))
+    print('{n} benchmarks, {r} regressions, {f} failures'.format(n=len(results), r=len(regressions), f=failed))
+    return 1 if len(regressions) > 0 or failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
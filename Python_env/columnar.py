@@ -0,0 +1,42 @@
+def toGeoParquet(df, path, compression='snappy'):
+    """ Exports a StudyRegionDataFrame to GeoParquet without changing the input frame
+
+        Keyword Arguments: \n
+            df: StudyRegionDataFrame -- a frame with a WKT or shapely geometry column, or a block, tract, or county column
+            path: str -- the output path (example: 'C:/directory/results.parquet')
+            compression: str -- the Parquet compression codec (choices: 'snappy', 'gzip', 'brotli', 'zstd', None)
+    """
+    import pandas as pd
+    import geopandas as gpd
+    from shapely.wkt import loads
+
+    if 'geometry' not in df.columns:
+        df = df.addGeometry()
+    geometry = gpd.GeoSeries([loads(str(x)) for x in df['geometry']], index=df.index)
+    gdf = gpd.GeoDataFrame(pd.DataFrame(df).drop(columns=['geometry']), geometry=geometry, crs='EPSG:4326')
+    gdf.to_parquet(path, compression=compression)
+
+
+def toParquet(df, path, compression='snappy'):
+    """ Exports a non-spatial dataframe to Parquet
+
+        Keyword Arguments: \n
+            df: pandas dataframe -- the frame to export
+            path: str -- the output path (example: 'C:/directory/building_damage_by_type.parquet')
+            compression: str -- the Parquet compression codec (choices: 'snappy', 'gzip', 'brotli', 'zstd', None)
+    """
+    import pandas as pd
+    pd.DataFrame(df).to_parquet(path, compression=compression, index=False)
+
+
+def toFeather(df, path, compression='lz4'):
+    """ Exports a non-spatial dataframe to Feather (Arrow IPC)
+
+        Keyword Arguments: \n
+            df: pandas dataframe -- the frame to export
+            path: str -- the output path (example: 'C:/directory/building_damage_by_type.feather')
+            compression: str -- the Feather compression codec (choices: 'lz4', 'zstd', 'uncompressed')
+    """
+    import pandas as pd
+    # feather only stores a default index
+    pd.DataFrame(df).reset_index(drop=True).to_feather(path, compression=compression)
@@ -0,0 +1,312 @@
+import sys
+import threading
+import weakref
+from collections import deque
+from time import time
+
+
+class PoolExhausted(Exception):
+    """ raised when no pooled connection is released within the acquire timeout """
+    pass
+
+
+class ConnectionPool():
+    """ A bounded pool of database connections of one hazpy class and database, see ConnectionPools
+
+        Opening a connection to the local SQL Server instance tries the installed ODBC drivers one at a time,
+        which adds noticeable latency to every study region that is opened. The pool keeps a few connections
+        open and leases one for the duration of a query. Idle connections stay open for the keep-alive time
+        and are closed after it; a connection idle for longer than the health check interval is tested with
+        a cheap query before it is leased again and replaced if the test fails.
+
+        Keyword Arguments: \n
+            connect: function -- opens a new DB-API connection; may be set after the pool is created
+            maxSize: int -- the most connections open at once
+            keepAlive: int -- seconds an idle connection stays open
+            healthCheckInterval: int -- seconds a connection can be idle before it is tested
+            acquireTimeout: int -- seconds to wait for a free connection before raising PoolExhausted
+            healthCheck: str -- the query that tests a connection
+    """
+
+    def __init__(self, connect=None, maxSize=4, keepAlive=300, healthCheckInterval=30, acquireTimeout=30, healthCheck='SELECT 1'):
+        self.connect = connect
+        self.maxSize = max(1, int(maxSize))
+        self.keepAlive = keepAlive
+        self.healthCheckInterval = healthCheckInterval
+        self.acquireTimeout = acquireTimeout
+        self.healthCheck = healthCheck
+        # (connection, released time) of the idle connections, most recently released last
+        self._idle = deque()
+        self._open = 0
+        self._condition = threading.Condition()
+        self.stats = {'opened': 0, 'reused': 0, 'replaced': 0, 'expired': 0}
+
+    def acquire(self):
+        """ Leases a connection - an idle one if there is one, otherwise a new one while the pool has room
+
+            Returns:
+                conn: a DB-API connection that must be given back with release()
+        """
+        deadline = time() + self.acquireTimeout
+        with self._condition:
+            self.expireIdle()
+            while len(self._idle) == 0 and self._open >= self.maxSize:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise PoolExhausted('No database connection was released within {s} seconds'.format(s=self.acquireTimeout))
+                self._condition.wait(remaining)
+                self.expireIdle()
+            if len(self._idle) > 0:
+                conn, released = self._idle.pop()
+            else:
+                conn, released = None, None
+                # the slot is reserved while connecting, so the lock is not held during the slow connect
+                self._open += 1
+        if conn is not None:
+            if time() - released < self.healthCheckInterval or self.isHealthy(conn):
+                self.count('reused')
+                return conn
+            # the replacement keeps the slot of the broken connection
+            self.closeConnection(conn)
+            self.count('replaced')
+        try:
+            conn = self.connect()
+        except:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+        self.count('opened')
+        return conn
+
+    def count(self, stat):
+        with self._condition:
+            self.stats[stat] += 1
+
+    def release(self, conn, broken=False):
+        """ Gives a leased connection back to the pool
+
+            Keyword Arguments: \n
+                conn: the connection from acquire()
+                broken: bool -- close the connection instead of keeping it (example: the query failed with a connection error)
+        """
+        if broken:
+            self.closeConnection(conn)
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            self._idle.append((conn, time()))
+            self._condition.notify()
+
+    def isHealthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.healthCheck)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except:
+            return False
+
+    def expireIdle(self):
+        """ closes the connections idle for longer than the keep-alive time - called with the lock held """
+        now = time()
+        while len(self._idle) > 0 and now - self._idle[0][1] > self.keepAlive:
+            conn, released = self._idle.popleft()
+            self.closeConnection(conn)
+            self._open -= 1
+            self.stats['expired'] += 1
+
+    def closeConnection(self, conn):
+        try:
+            conn.close()
+        except:
+            print('Unable to close a pooled connection: ' + str(sys.exc_info()[0]))
+
+    def close(self):
+        """ closes every idle connection - leased connections are closed when they are released broken or expire """
+        with self._condition:
+            while len(self._idle) > 0:
+                conn, released = self._idle.popleft()
+                self.closeConnection(conn)
+                self._open -= 1
+            self._condition.notify_all()
+
+    def connection(self):
+        """ returns a PooledConnection, a stand-in for a DB-API connection that leases a pooled connection per query """
+        return PooledConnection(self)
+
+
+class ConnectionPools():
+    """ The connection pools of the app - one ConnectionPool per hazpy class and database
+
+        A StudyRegion and the HazusDB open connections with their own createConnection(), possibly to
+        different databases, so their connections are never leased to one another. Every pool is created
+        with the same options and is bounded on its own.
+
+        Keyword Arguments: \n
+            options: the ConnectionPool keyword arguments (maxSize, keepAlive, healthCheckInterval, acquireTimeout, healthCheck)
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, key, connect):
+        """ returns the pool of a key, creating it with the connect function if it does not exist yet """
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = ConnectionPool(connect, **self.options)
+            return self._pools[key]
+
+    def close(self):
+        """ closes the idle connections of every pool """
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+
+class PooledConnection():
+    """ A DB-API connection stand-in handed to hazpy objects in place of their own connection
+
+        Every cursor leases a pooled connection when it executes and gives it back when it is closed or
+        garbage collected, so a StudyRegion that lives as long as the app only holds a connection while it
+        queries. pandas.read_sql closes its cursor once the rows are read. commit() and rollback() apply to
+        the connections leased by the open cursors; work not committed when a cursor closes is rolled back
+        before its connection is reused.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self):
+        cursor = PooledCursor(self.pool)
+        self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, *args):
+        cursor = self.cursor()
+        cursor.execute(*args)
+        return cursor
+
+    def commit(self):
+        for cursor in list(self._cursors):
+            cursor.commitLeased()
+
+    def rollback(self):
+        for cursor in list(self._cursors):
+            cursor.rollbackLeased()
+
+    def close(self):
+        for cursor in list(self._cursors):
+            cursor.close()
+
+
+class PooledCursor():
+    """ A DB-API cursor that leases a pooled connection on execute and releases it on close """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._conn = None
+        self._cursor = None
+
+    def execute(self, *args):
+        if self._conn is None:
+            self._conn = self.pool.acquire()
+        try:
+            if self._cursor is None:
+                self._cursor = self._conn.cursor()
+            self._cursor.execute(*args)
+        except:
+            # a failed query may have broken the connection, so it is not reused
+            self.close(broken=not self.pool.isHealthy(self._conn))
+            raise
+        return self
+
+    def __getattr__(self, name):
+        # fetchall, fetchmany, description, rowcount, ... of the leased cursor
+        if name.startswith('_') or self._cursor is None:
+            raise AttributeError(name)
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def commitLeased(self):
+        """ commits the work of the leased connection, if the cursor holds one """
+        if self._conn is not None:
+            self._conn.commit()
+
+    def rollbackLeased(self):
+        """ rolls back the work of the leased connection, if the cursor holds one """
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self, broken=False):
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except:
+                broken = True
+            self._cursor = None
+        if self._conn is not None:
+            conn = self._conn
+            self._conn = None
+            if not broken:
+                # the next lease must not inherit an open transaction
+                try:
+                    conn.rollback()
+                except:
+                    broken = True
+            self.pool.release(conn, broken)
+
+    def __del__(self):
+        self.close()
+
+
+_pooledClasses = {}
+_pooledClassesLock = threading.Lock()
+
+
+def connectionFactory(base, instance):
+    """ Returns a function opening a connection with hazpy's createConnection() for the database of an instance
+
+        The function works on a copy of the instance attributes, so a pool holding it does not keep the
+        instance alive.
+    """
+    attributes = dict(vars(instance))
+
+    def connect():
+        surrogate = base.__new__(base)
+        surrogate.__dict__.update(attributes)
+        return base.createConnection(surrogate)
+    return connect
+
+
+def pooledClass(base, pools):
+    """ Returns a subclass of a hazpy class (StudyRegion or HazusDB) whose connections are leased from a pool
+
+        hazpy opens the connection in createConnection(); the subclass returns a PooledConnection instead, leased
+        from the pool of the class and database (the study region name) - the pool opens its connections with
+        hazpy's own createConnection. Connections of another kind (example: createConnection(orm='sqlalchemy'))
+        are opened by hazpy as before.
+
+        Keyword Arguments: \n
+            base: class -- the hazpy class
+            pools: ConnectionPools -- the pools of the app
+    """
+    with _pooledClassesLock:
+        key = (base, id(pools))
+        if key not in _pooledClasses:
+            def createConnection(self, *args, **kwargs):
+                if len(args) > 0 or len(kwargs) > 0:
+                    return base.createConnection(self, *args, **kwargs)
+                pool = pools.pool((base.__name__, getattr(self, 'name', None)), connectionFactory(base, self))
+                return pool.connection()
+            _pooledClasses[key] = type('Pooled' + base.__name__, (base,), {'createConnection': createConnection})
+        return _pooledClasses[key]
@@ -0,0 +1,51 @@
+import gzip
+from time import time
+
+
+def frameChunks(df, chunkSize=50000):
+    """ Yields slices of a fetched dataframe, so the progress can be reported as the CSV is written
+
+        Keyword Arguments: \n
+            df: pandas dataframe -- the frame to split
+            chunkSize: int -- the number of rows between progress reports
+    """
+    if len(df) == 0:
+        yield df
+    for start in range(0, len(df), chunkSize):
+        yield df.iloc[start:start + chunkSize]
+
+
+def writeCSV(chunks, path, compress=False, progress=None):
+    """ Writes dataframe chunks to one CSV with the layout of hazpy's toCSV() - the index is the first column
+
+        The frames are fetched whole and shared with the other formats, so the memory used grows with the
+        table size; the chunks only let the writer report its progress and rows per second.
+
+        Keyword Arguments: \n
+            chunks: iterable -- pandas dataframes with the same columns, see frameChunks()
+            path: str -- the output path; '.gz' is appended when compressing
+            compress: bool -- gzip the output
+            progress: function -- optional progress(rows) called with the rows written after every chunk
+        Returns:
+            stats: dict -- the path, rows, seconds, and rowsPerSecond written
+    """
+    if compress and not path.endswith('.gz'):
+        path = path + '.gz'
+    t0 = time()
+    rows = 0
+    if compress:
+        outputFile = gzip.open(path, 'wt', newline='', encoding='utf-8')
+    else:
+        outputFile = open(path, 'w', newline='', encoding='utf-8')
+    with outputFile:
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(outputFile, header=header)
+            header = False
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+    seconds = time() - t0
+    rowsPerSecond = rows / seconds if seconds > 0 else float(rows)
+    print('Wrote {r} rows to {p} ({s:.0f} rows/s)'.format(r=rows, p=path, s=rowsPerSecond))
+    return {'path': path, 'rows': rows, 'seconds': seconds, 'rowsPerSecond': rowsPerSecond}
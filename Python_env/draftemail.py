@@ -1,142 +1,79 @@
 import os
+from string import Template
+
+import numpy as np
+import pandas as pd
 import win32com.client as win32
 
 
-def draftEmail(studyRegion):
-    def abbreviateValue(number):
-        try:
-            digits = 0
-            number = float(number)
-            formattedString = str("{:,}".format(round(number, digits)))
-            if ('.' in formattedString) and (digits == 0):
-                formattedString = formattedString.split('.')[0]
-            if (number > 1000) and (number < 1000000):
-                split = formattedString.split(',')
-                formattedString = split[0] + '.' + split[1][0:-1] + ' K'
-            if (number > 1000000) and (number < 1000000000):
-                split = formattedString.split(',')
-                formattedString = split[0] + '.' + split[1][0:-1] + ' M'
-            if (number > 1000000000) and (number < 1000000000000):
-                split = formattedString.split(',')
-                formattedString = split[0] + '.' + split[1][0:-1] + ' B'
-            if (number > 1000000000000) and (number < 1000000000000000):
-                split = formattedString.split(',')
-                formattedString = split[0] + '.' + split[1][0:-1] + ' T'
-            return formattedString
-        except:
-            return str(number)
-
-    def addCommas(number, abbreviate=False, truncate=False):
-        if truncate:
-            number = int(round(number))
-        if abbreviate:
-            number = abbreviateValue(number)
-        else:
-            number = "{:,}".format(number)
-        return number
-
-    def toDollars(number, abbreviate=False, truncate=False):
-        if truncate:
-            number = int(round(number))
-        if abbreviate:
-            dollars = abbreviateValue(number)
-            dollars = '$' + dollars
-        else:
-            dollars = '$'+"{:,}".format(number)
-            dollarsSplit = dollars.split('.')
-            if len(dollarsSplit) > 1:
-                dollars = '.'.join([dollarsSplit[0], dollarsSplit[1][0:1]])
-        return dollars
-
-    def getResidentalDamageCounts():
-        sql="""select p.tract, affected * RESI as affected, minor * RESI as minor, major * RESI as major, destroyed * RESI as destroyed from 
-            (select TRACT as tract, avg(MINOR) as affected, avg(MODERATE) as minor, avg(SEVERE) as major, avg(COMPLETE) as destroyed FROM [{s}].[dbo].[huOccResultsT]
-            where Occupancy = 'RES'
-            group by tract) p
-            inner join
-            (SELECT TRACT as tract, RESI
-            FROM [{s}].[dbo].[hzBldgCountOccupT]) c
-            on p.tract = c.tract""".format(s=studyRegion.name)
-        queryset = studyRegion.query(sql)
-        qs_counties = queryset.addCounties()
-        return qs_counties
-
-    def createDraftEmail(HTML='', subject='Hazus Wind Loss Modeling – Hurricane [HURRICANE_NAME] for Advisory [ADVISORY_NUMBER]', recipient='', send=False):
-
-        if len(HTML) == 0:
-            results = studyRegion.getResults()
-            residential = getResidentalDamageCounts()
-            html_df = results.merge(residential, on='tract')
-
-            resultsHTML = ''
-            listLimit = 5
-            for state in html_df['state'].unique():
-                slice = html_df[html_df['state'] == state]
-                slice_grouped = slice.groupby(by=['county']).sum()
-
-                # economic loss
-                total_econloss = toDollars(slice['EconLoss'].sum(), abbreviate=True)
-                econloss_df = slice_grouped.sort_values('EconLoss', ascending=False)[0:listLimit]
-                econloss = ''
-                for row in range(len(econloss_df)):
-                    county = econloss_df.index[row]
-                    loss = toDollars(econloss_df.iloc[row]['EconLoss'], abbreviate=True)
-                    html = """<li>{l} – {c}</li>""".format(l=loss, c=county)
-                    econloss += html
-
-                # residential building damage counts
-                res_affected = addCommas(slice_grouped['affected'].sum(), truncate=True)
-                res_minor = addCommas(slice_grouped['minor'].sum(), truncate=True)
-                res_major = addCommas(slice_grouped['major'].sum(), truncate=True)
-                res_destroyed = addCommas(slice_grouped['destroyed'].sum(), truncate=True)
-
-                # displaced households and shelter needs
-                displacedHouseholds = addCommas(slice_grouped['DisplacedHouseholds'].sum(), truncate=True)
-                shelterNeeds = addCommas(slice_grouped['ShelterNeeds'].sum(), truncate=True)
-
-                # debris
-                total_debris = abbreviateValue(slice_grouped['DebrisTotal'].sum())
-                debris_bw = abbreviateValue(slice_grouped['DebrisBW'].sum())
-                debris_cs = abbreviateValue(slice_grouped['DebrisCS'].sum())
-                debris_tree = abbreviateValue(slice_grouped['DebrisTree'].sum())
-                debris_eligibleTree = abbreviateValue(slice_grouped['DebrisEligibleTree'].sum())
-
-                update_html = """
-                    <br />
-                    <br />
-                    <strong>"""+state+"""</strong>
-                    <ul class="results-container">
-                        <ul class="results">
-                            <li>"""+total_econloss+""" in Total Economic Loss. The """+str(listLimit)+""" counties with the highest modeled economic impacts are below:</li>
-                            <ul class="results-details">
-                                """+econloss+"""
-                            </ul>
-                        </ul>
-                        <ul class="results">
-                            <li>Number of Residential Buildings Damaged</li>
-                            <ul class="results-details">
-                                <li>Affected – {resa}</li>
-                                <li>Minor – {resmin}</li>
-                                <li>Major – {resmaj}</li>
-                                <li>Destroyed – {resdes}</li>
-                            </ul>
-                        </ul>
-                        <ul class="results">
-                            <li>{dh} Displaced Household and {sn} Short-Term Shelter Needs</li>
-                        </ul>
-                        <ul class="results">
-                            <li>{td} Total Tons of Debris</li>
-                            <ul class="results-details">
-                                <li>{dbw} tons of Brick/Wood Debris</li>
-                                <li>{dcs} tons of Concrete/Steel Debris</li>
-                                <li>{dt} tons of Tree Debris ({det} tons of tree debris on or near public right-of-way)</li>
-                            </ul>
-                        </ul>
-                    </ul>
-                        """.format(resa=res_affected, resmin=res_minor, resmaj=res_major, resdes=res_destroyed, dh=displacedHouseholds, sn=shelterNeeds, td=total_debris, dbw=debris_bw, dcs=debris_cs, dt=debris_tree, det=debris_eligibleTree)
-                resultsHTML += update_html
+# the huDebrisResultsT column of the tree debris eligible for removal, by the names it has had in Hazus releases
+eligibleTreeColumns = ['ELIGIBLETREEVOLUME', 'ELIGIBLETREE']
+
+
+def eligibleTreeColumn(studyRegion):
+    """ returns the eligible tree debris column of the study region's huDebrisResultsT, or None if it has none """
+    sql = """SELECT name FROM [{s}].sys.columns WHERE object_id = OBJECT_ID('[{s}].[dbo].[huDebrisResultsT]')""".format(s=studyRegion.name)
+    columns = {str(x).upper(): str(x) for x in studyRegion.query(sql)['name']}
+    for column in eligibleTreeColumns:
+        if column in columns:
+            return columns[column]
+    print('No eligible tree debris column in huDebrisResultsT - the eligible tree debris is reported as 0')
+    return None
+
+
+def getCountySummary(studyRegion):
+    """ Queries the email metrics rolled up by state and county in a single round trip
+
+        Economic loss, residential building damage, displaced households, shelter needs, and debris are
+        summed by tract and then by county on the server, using the same tract formulas as
+        studyRegion.getResults(). Only tracts with both economic loss and residential damage are counted. The
+        eligible tree debris column is looked up first, since its name differs between Hazus releases.
+
+        Keyword Arguments: \n
+            studyRegion: StudyRegion -- an initialized hazpy StudyRegion with the hurricane hazard
+        Returns:
+            df: StudyRegionDataFrame -- one row per county with state, county, and the summaryColumns
+    """
+    sql = """WITH loss AS (
+            SELECT TRACT AS tract, SUM(ISNULL(TotLoss, 0)) * 1000 AS EconLoss FROM [{s}].[dbo].[huSummaryLoss] GROUP BY TRACT
+        ), residential AS (
+            SELECT p.tract, affected * RESI AS affected, minor * RESI AS minor, major * RESI AS major, destroyed * RESI AS destroyed FROM
+            (SELECT TRACT AS tract, AVG(MINOR) AS affected, AVG(MODERATE) AS minor, AVG(SEVERE) AS major, AVG(COMPLETE) AS destroyed
+                FROM [{s}].[dbo].[huOccResultsT] WHERE Occupancy = 'RES' GROUP BY TRACT) p
+            INNER JOIN (SELECT TRACT AS tract, RESI FROM [{s}].[dbo].[hzBldgCountOccupT]) c
+            ON p.tract = c.tract
+        ), shelter AS (
+            SELECT TRACT AS tract, SUM(DISPLACEDHOUSEHOLDS) AS DisplacedHouseholds, SUM(SHORTTERMSHELTERNEEDS) AS ShelterNeeds
+            FROM [{s}].[dbo].[huShelterResultsT] GROUP BY TRACT
+        ), debris AS (
+            SELECT TRACT AS tract, SUM(BRICKANDWOOD) * 1000 AS DebrisBW, SUM(CONCRETEANDSTEEL) * 1000 AS DebrisCS, SUM(TREE) AS DebrisTree,
+            {e} AS DebrisEligibleTree,
+            (ISNULL(SUM(BRICKANDWOOD), 0) + ISNULL(SUM(CONCRETEANDSTEEL), 0)) * 1000 + ISNULL(SUM(TREE), 0) AS DebrisTotal
+            FROM [{s}].[dbo].[huDebrisResultsT] GROUP BY TRACT
+        )
+        SELECT county.State AS state, county.CountyName AS county, SUM(loss.EconLoss) AS EconLoss,
+            SUM(residential.affected) AS affected, SUM(residential.minor) AS minor, SUM(residential.major) AS major,
+            SUM(residential.destroyed) AS destroyed, SUM(shelter.DisplacedHouseholds) AS DisplacedHouseholds,
+            SUM(shelter.ShelterNeeds) AS ShelterNeeds, SUM(debris.DebrisTotal) AS DebrisTotal, SUM(debris.DebrisBW) AS DebrisBW,
+            SUM(debris.DebrisCS) AS DebrisCS, SUM(debris.DebrisTree) AS DebrisTree, SUM(debris.DebrisEligibleTree) AS DebrisEligibleTree
+        FROM loss
+        INNER JOIN residential ON loss.tract = residential.tract
+        INNER JOIN [{s}].[dbo].[hzCounty] county ON county.CountyFips = LEFT(loss.tract, 5)
+        LEFT JOIN shelter ON loss.tract = shelter.tract
+        LEFT JOIN debris ON loss.tract = debris.tract
+        GROUP BY county.State, county.CountyName
+        ORDER BY county.State, county.CountyName"""
+    column = eligibleTreeColumn(studyRegion)
+    eligibleTree = 'SUM([{c}])'.format(c=column) if column is not None else '0'
+    sql = sql.format(s=studyRegion.name, e=eligibleTree)
+    return studyRegion.query(sql)
 
-            HTML = """
+
+# the metrics summed for every state and county
+summaryColumns = ['EconLoss', 'affected', 'minor', 'major', 'destroyed', 'DisplacedHouseholds', 'ShelterNeeds',
+                  'DebrisTotal', 'DebrisBW', 'DebrisCS', 'DebrisTree', 'DebrisEligibleTree']
+
+emailTemplate = Template("""
             <html>
             <head>
                 <style type="text/css">
@@ -158,18 +95,137 @@ def draftEmail(studyRegion):
             <p>Greetings,</p>
             <p>We have completed wind loss modeling for Hurricane [HURRICANE_NAME] based on Advisory [ADVISORY_NUMBER]. Hazus does not generate impact assessments for wind below 50 mph; therefore, locations with lower windspeeds were excluded from the model.  Attached are Hazus results and a snapshot summary is below:</p>
             <strong>Hurricane [HURRICANE_NAME] Hazus Hurricane Wind Loss Modeling for Advisory [ADVISORY_NUMBER] Loss Summary</strong>
-            """+resultsHTML+"""
+            $states
             </body>
             </html>
-            """
-
-        outlook = win32.Dispatch('outlook.application')
-        mail = outlook.CreateItem(0)
-        mail.To = recipient
-        mail.Subject = subject
-        mail.HtmlBody = HTML
-        if send:
-            mail.send()
-        else:
-            mail.save()
-    createDraftEmail()
\ No newline at end of file
+            """)
+
+stateTemplate = Template("""
+                    <br />
+                    <br />
+                    <strong>$state</strong>
+                    <ul class="results-container">
+                        <ul class="results">
+                            <li>$EconLoss in Total Economic Loss. The $listLimit counties with the highest modeled economic impacts are below:</li>
+                            <ul class="results-details">
+                                $counties
+                            </ul>
+                        </ul>
+                        <ul class="results">
+                            <li>Number of Residential Buildings Damaged</li>
+                            <ul class="results-details">
+                                <li>Affected – $affected</li>
+                                <li>Minor – $minor</li>
+                                <li>Major – $major</li>
+                                <li>Destroyed – $destroyed</li>
+                            </ul>
+                        </ul>
+                        <ul class="results">
+                            <li>$DisplacedHouseholds Displaced Household and $ShelterNeeds Short-Term Shelter Needs</li>
+                        </ul>
+                        <ul class="results">
+                            <li>$DebrisTotal Total Tons of Debris</li>
+                            <ul class="results-details">
+                                <li>$DebrisBW tons of Brick/Wood Debris</li>
+                                <li>$DebrisCS tons of Concrete/Steel Debris</li>
+                                <li>$DebrisTree tons of Tree Debris ($DebrisEligibleTree tons of tree debris on or near public right-of-way)</li>
+                            </ul>
+                        </ul>
+                    </ul>
+                        """)
+
+countyTemplate = Template("""<li>$EconLoss – $county</li>""")
+
+
+def abbreviateValues(values):
+    """ Formats numbers with a K, M, B, or T suffix, truncated to two decimals (example: 12345 -> '12.34 K')
+
+        Keyword Arguments: \n
+            values: pandas series -- the numbers to format
+        Returns:
+            formatted: pandas series -- the formatted strings
+    """
+    numbers = np.round(values.astype(float).to_numpy())
+    magnitude = np.select(
+        [(numbers > 1e3) & (numbers < 1e6), (numbers > 1e6) & (numbers < 1e9),
+         (numbers > 1e9) & (numbers < 1e12), (numbers > 1e12) & (numbers < 1e15)],
+        [1, 2, 3, 4], 0)
+    # truncate rather than round, so 1,999 reads 1.99 K and not 2.00 K
+    scaled = np.floor(numbers / np.power(10.0, 3 * magnitude - 2)) / 100
+    abbreviated = np.char.add(np.char.mod('%.2f', scaled), np.array(['', ' K', ' M', ' B', ' T'])[magnitude])
+    formatted = pd.Series(abbreviated, index=values.index)
+    small = magnitude == 0
+    formatted[small] = formatCounts(values[small])
+    return formatted
+
+
+def formatCounts(values):
+    """ formats numbers as whole numbers with commas (example: 12345.6 -> '12,346') """
+    return values.astype(float).round().map('{:,.0f}'.format)
+
+
+def formatDollars(values):
+    """ formats dollar amounts abbreviated with a $ prefix (example: 12345 -> '$12.34 K') """
+    return '$' + abbreviateValues(values)
+
+
+def summarizeByCounty(df, listLimit=5):
+    """ Sums the email metrics by state and county in a single grouped aggregation
+
+        Keyword Arguments: \n
+            df: pandas dataframe -- county (or tract) rows with state, county, and the summaryColumns, see getCountySummary()
+            listLimit: int -- the number of counties listed per state
+        Returns:
+            states: pandas dataframe -- the metric totals of each state, in the order the states first appear
+            topCounties: pandas dataframe -- the listLimit counties with the highest economic loss in each state
+    """
+    counties = df.groupby(['state', 'county'], sort=False)[summaryColumns].sum().reset_index()
+    states = counties.groupby('state', sort=False)[summaryColumns].sum().reset_index()
+    topCounties = counties.sort_values('EconLoss', ascending=False, kind='mergesort').groupby('state', sort=False).head(listLimit)
+    return states, topCounties
+
+
+def renderSummaryHTML(states, topCounties, listLimit=5):
+    """ Renders the email body from the state totals and top counties of summarizeByCounty() """
+    topCounties = topCounties.assign(EconLoss=formatDollars(topCounties['EconLoss']))
+    countyItems = {}
+    for county in topCounties.to_dict('records'):
+        countyItems.setdefault(str(county['state']), []).append(countyTemplate.substitute(county))
+
+    formatted = pd.DataFrame({'state': states['state'].astype(str)})
+    formatted['EconLoss'] = formatDollars(states['EconLoss'])
+    for column in ['affected', 'minor', 'major', 'destroyed', 'DisplacedHouseholds', 'ShelterNeeds']:
+        formatted[column] = formatCounts(states[column])
+    for column in ['DebrisTotal', 'DebrisBW', 'DebrisCS', 'DebrisTree', 'DebrisEligibleTree']:
+        formatted[column] = abbreviateValues(states[column])
+
+    stateSections = [stateTemplate.substitute(state, listLimit=listLimit, counties=''.join(countyItems.get(state['state'], [])))
+        for state in formatted.to_dict('records')]
+    return emailTemplate.substitute(states=''.join(stateSections))
+
+
+def createDraftEmail(HTML, subject='Hazus Wind Loss Modeling – Hurricane [HURRICANE_NAME] for Advisory [ADVISORY_NUMBER]', recipient='', send=False):
+    """ saves an Outlook email to the drafts folder, or sends it """
+    outlook = win32.Dispatch('outlook.application')
+    mail = outlook.CreateItem(0)
+    mail.To = recipient
+    mail.Subject = subject
+    mail.HtmlBody = HTML
+    if send:
+        mail.send()
+    else:
+        mail.save()
+
+
+def draftEmail(studyRegion, countySummary=None, listLimit=5):
+    """ Drafts an Outlook email summarizing the hurricane losses by state and county
+
+        Keyword Arguments: \n
+            studyRegion: StudyRegion -- an initialized hazpy StudyRegion
+            countySummary: pandas dataframe -- optional pre-fetched getCountySummary(studyRegion)
+            listLimit: int -- the number of counties listed per state
+    """
+    if countySummary is None:
+        countySummary = getCountySummary(studyRegion)
+    states, topCounties = summarizeByCounty(countySummary, listLimit)
+    createDraftEmail(renderSummaryHTML(states, topCounties, listLimit))
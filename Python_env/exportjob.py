@@ -0,0 +1,527 @@
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from artifactcache import ArtifactCache
+from columnar import toFeather, toGeoParquet, toParquet
+from csvwriter import frameChunks, writeCSV
+from geopackage import writeGeoPackage
+from hazardraster import writeHazardRaster
+from instrumentation import Instrumentation
+from manifest import ExportManifest
+from outputgeometry import outputGeometry
+from progress import ProgressModel
+from reportbuilder import ReportBuilder
+from resultcache import analysisKey
+from vectortiles import writeVectorTiles
+
+
+class ExportCancelled(Exception):
+    """ raised between export steps when the user cancels the job """
+    pass
+
+
+class ExportJob():
+    """ Runs the export pipeline for a study region on a background worker thread
+
+        The job drafts the email, fetches every frame the selected formats need, then fans the fetched
+        frames out to the format writers on a thread pool. Progress, warnings and errors are posted to
+        the events queue as (kind, payload) tuples so the tkinter mainloop can poll for them without
+        blocking. Event kinds: 'progress' -> (value, message, eta), 'warning' -> message, 'error' -> message,
+        'complete' -> outputPath, 'cancelled' -> None, 'failed' -> message
+
+        Keyword Arguments: \n
+            studyRegion: StudyRegion -- an initialized hazpy StudyRegion with the hazard, scenario, and return period set
+            outputPath: str -- the directory the exported files are written to
+            exportOptions: dict -- the export checkbox values (csv, shapefile, geojson, parquet, geopackage, vectortiles, geotiff, report, draftEmail)
+            reportTitle: str -- the report title; the hazpy default is used if empty
+            reportSubtitle: str -- the report subtitle; the hazpy default is used if empty
+            workers: int -- the number of format writers that run at the same time
+            resultCache: ResultCache -- optional on-disk cache the query results are served from
+            csvProgressRows: int -- the number of rows written between progress reports when writing CSVs
+            csvGzip: bool -- gzip the CSVs (written as .csv.gz)
+            parquetCompression: str -- the GeoParquet and Parquet compression codec (choices: 'snappy', 'gzip', 'brotli', 'zstd')
+            tableFormat: str -- the columnar format of the non-spatial damage tables (choices: 'parquet', 'feather')
+            geopackageBatchSize: int -- the number of rows inserted per batch when writing the GeoPackage
+            incremental: bool -- skip files whose source data and parameters have not changed since the last export
+            reportBuilder: ReportBuilder -- builds the PDF report from the fetched frames; a builder without a disk cache is used if None
+            spanLog: str -- optional JSON lines file the stage spans are appended to, see Instrumentation
+            profileDirectory: str -- optional directory of a cProfile dump of the job
+            traceMemory: bool -- record the memory in use in every span with tracemalloc
+            progressHistory: str -- optional JSON file of the step durations the progress and ETA are weighted by, see ProgressModel
+            geometryPrecision: int -- the decimal places of the shapefile and GeoJSON coordinates; full precision if None
+            simplifyTolerance: float -- the shapefile and GeoJSON simplification tolerance in degrees; not simplified if None
+            levelsOfDetail: list -- optional simplification tolerances of additional coarser shapefile and GeoJSON layers, written as <layer>_lod1, <layer>_lod2, ...
+            vectorTiles: dict -- the zoom levels and summary attributes of the vector tiles (minZoom, maxZoom, detailZoom, summaryAttributes), see writeVectorTiles
+            hazardRaster: dict -- the resolution and layout of the hazard GeoTIFF (valueFields, resolution, blockSize, compression, resampling), see writeHazardRaster
+    """
+
+    # (getterName, label, fileName, failureMessage, spatial, exported to CSV)
+    layers = [
+        ('getResults', 'results', 'results', 'Base results not available to export.', True, True),
+        ('getEssentialFacilities', 'damaged facilities', 'damaged_facilities', 'Damaged facilities not available to export.', True, True),
+        ('getHazardGeoDataFrame', 'hazard', 'hazard', 'Hazard not available to export.', True, False),
+        ('getBuildingDamageByOccupancy', 'building damage by occupancy', 'building_damage_by_occupancy', 'Building damage by occupancy not available to export.', False, True),
+        ('getBuildingDamageByType', 'building damage by type', 'building_damage_by_type', 'Building damage by type not available to export.', False, True)
+    ]
+
+    def __init__(self, studyRegion, outputPath, exportOptions, reportTitle='', reportSubtitle='', workers=4, resultCache=None,
+                 csvProgressRows=50000, csvGzip=False, parquetCompression='snappy', tableFormat='parquet', geopackageBatchSize=10000,
+                 incremental=False, reportBuilder=None, spanLog=None, profileDirectory=None, traceMemory=False,
+                 progressHistory=None, geometryPrecision=None, simplifyTolerance=None, levelsOfDetail=None, vectorTiles=None, hazardRaster=None):
+        self.studyRegion = studyRegion
+        self.outputPath = outputPath
+        self.exportOptions = exportOptions
+        self.reportTitle = reportTitle
+        self.reportSubtitle = reportSubtitle
+        self.workers = max(1, int(workers))
+        self.csvProgressRows = max(1, int(csvProgressRows))
+        self.csvGzip = csvGzip
+        self.parquetCompression = parquetCompression
+        self.tableFormat = tableFormat
+        self.geopackageBatchSize = max(1, int(geopackageBatchSize))
+        self.incremental = incremental
+        self.geometryPrecision = geometryPrecision
+        self.simplifyTolerance = simplifyTolerance
+        self.levelsOfDetail = list(levelsOfDetail or [])
+        self.vectorTiles = dict(vectorTiles or {})
+        self.hazardRaster = dict(hazardRaster or {})
+        self.reportBuilder = reportBuilder or ReportBuilder(cacheDirectory=None)
+
+        self.events = queue.Queue()
+        # seconds spent in each step, keyed by the step message
+        self.timings = {}
+        self.elapsedTime = None
+        # rows, seconds, and rows per second of every CSV, keyed by path
+        self.csvStats = {}
+        # (message, failureMessage, error, showError) for every writer that failed
+        self.writerErrors = []
+        # messages of the writers skipped because their files are current
+        self.skipped = []
+        self.manifest = None
+
+        attributes = analysisKey(studyRegion)
+        attributes['outputPath'] = outputPath
+        self.instrumentation = Instrumentation(spanLog, profileDirectory, traceMemory, attributes)
+
+        # every frame is fetched once and shared by the email, the writers, and later steps
+        self.cache = ArtifactCache(studyRegion, resultCache, self.instrumentation)
+
+        # the percent done and time left, weighted by how long each step took in earlier exports
+        self.progress = ProgressModel(progressHistory)
+
+        self._cancelEvent = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ starts the export on a daemon worker thread and returns immediately """
+        self._thread = threading.Thread(target=self.run, name='ExportJob', daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """ requests cancellation - the job stops before its next step """
+        self._cancelEvent.set()
+
+    def isCancelled(self):
+        return self._cancelEvent.is_set()
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def fileExportSelected(self):
+        """ returns True if any option that writes to the output directory is selected """
+        return self.exportOptions.get('csv', 0) + self.exportOptions.get('shapefile', 0) + \
+            self.exportOptions.get('geojson', 0) + self.exportOptions.get('parquet', 0) + \
+            self.exportOptions.get('geopackage', 0) + self.exportOptions.get('vectortiles', 0) + self.exportOptions.get('geotiff', 0) + \
+            self.exportOptions.get('report', 0) > 0
+
+    def buildSteps(self, requiredGetters=None):
+        """ builds the ordered list of steps that run before the writers - the email and the database fetches
+
+            Each step is a (message, function, failureMessage, showError, stage) tuple. Failures of steps with
+            showError set are posted as error events; the others are only printed, so a missing optional
+            layer does not interrupt the export.
+
+            Keyword Arguments: \n
+                requiredGetters: set -- the getters the writers still need; every selected layer is fetched if None
+            Returns:
+                steps: list -- step tuples in run order
+        """
+        steps = []
+        if self.exportOptions.get('draftEmail', 0):
+            steps.append(('Drafting email', self.draftEmail, 'unable to draft email', False, 'email'))
+        if not self.fileExportSelected():
+            return steps
+
+        def required(*getterNames):
+            return requiredGetters is None or any(x in requiredGetters for x in getterNames)
+
+        if required('getResults', 'getEssentialFacilities'):
+            steps.append(('Retrieving base results', self.retrieveBaseResults, 'Unexpected error retrieving base results', True, 'fetch'))
+        if (self.exportOptions.get('csv', 0) or self.exportOptions.get('parquet', 0) or self.exportOptions.get('geopackage', 0)) and \
+                required('getBuildingDamageByOccupancy', 'getBuildingDamageByType'):
+            steps.append(('Retrieving building damage by occupancy', self.cache.getBuildingDamageByOccupancy,
+                'Building damage by occupancy not available to export.', False, 'fetch'))
+            steps.append(('Retrieving building damage by type', self.cache.getBuildingDamageByType,
+                'Building damage by type not available to export.', False, 'fetch'))
+        if (self.exportOptions.get('shapefile', 0) or self.exportOptions.get('geojson', 0) or
+                self.exportOptions.get('parquet', 0) or self.exportOptions.get('geopackage', 0) or
+                self.exportOptions.get('vectortiles', 0) or self.exportOptions.get('geotiff', 0)) and required('getHazardGeoDataFrame'):
+            steps.append(('Retrieving hazard', self.cache.getHazardGeoDataFrame,
+                'Hazard not available to export.', False, 'fetch'))
+        return steps
+
+    def buildWriters(self):
+        """ builds the format writers for the selected export options
+
+            Each writer is a (getterName, message, function, failureMessage, showError, artifact) tuple, where
+            artifact is the (name, paths, parameters) the export manifest tracks. hazpy converts the geometry
+            column in place when writing spatial formats, so the writers that read the same frame run one
+            after another in a single pool task.
+
+            Returns:
+                writers: list -- writer tuples
+        """
+        writers = []
+        if not self.fileExportSelected():
+            return writers
+
+        # (formatName, extension, write(frame, path), layers the format applies to: 'csv', 'spatial', or 'table', parameters)
+        formats = []
+        if self.exportOptions.get('csv', 0):
+            formats.append(('CSV', 'csv.gz' if self.csvGzip else 'csv', self.writeCSV, 'csv', {}))
+        # (formatName, extension, StudyRegionDataFrame method) of the formats written with the output geometry
+        geometryFormats = []
+        if self.exportOptions.get('shapefile', 0):
+            geometryFormats.append(('Shapefile', 'shp', 'toShapefile'))
+        if self.exportOptions.get('geojson', 0):
+            geometryFormats.append(('GeoJSON', 'geojson', 'toGeoJSON'))
+        for formatName, extension, method in geometryFormats:
+            formats.append((formatName, extension, self.geometryWriter(method, self.simplifyTolerance), 'spatial',
+                {'precision': self.geometryPrecision, 'tolerance': self.simplifyTolerance}))
+        if self.exportOptions.get('parquet', 0):
+            formats.append(('GeoParquet', 'parquet', lambda frame, path: toGeoParquet(frame, path, self.parquetCompression), 'spatial',
+                {'compression': self.parquetCompression}))
+            if self.tableFormat == 'feather':
+                formats.append(('Feather', 'feather', lambda frame, path: toFeather(frame, path), 'table', {}))
+            else:
+                formats.append(('Parquet', 'parquet', lambda frame, path: toParquet(frame, path, self.parquetCompression), 'table',
+                    {'compression': self.parquetCompression}))
+
+        for getterName, label, fileName, failureMessage, spatial, csv in self.layers:
+            for formatName, extension, write, target, parameters in formats:
+                if (target == 'csv' and not csv) or (target == 'spatial' and not spatial) or (target == 'table' and spatial):
+                    continue
+                path = self.outputPath + '/' + fileName + '.' + extension
+                artifact = (fileName + '.' + extension, self.artifactFiles(path), dict(parameters, format=formatName))
+                writers.append((getterName, 'Writing ' + label + ' to ' + formatName,
+                    self.frameWriter(getterName, write, path), failureMessage, False, artifact))
+
+        # coarser copies of the spatial layers for the zoomed out views of web maps
+        for level, tolerance in enumerate(self.levelsOfDetail, 1):
+            for getterName, label, fileName, failureMessage, spatial, csv in self.layers:
+                if not spatial:
+                    continue
+                for formatName, extension, method in geometryFormats:
+                    path = self.outputPath + '/' + fileName + '_lod' + str(level) + '.' + extension
+                    parameters = {'format': formatName, 'precision': self.geometryPrecision, 'tolerance': tolerance}
+                    artifact = (os.path.basename(path), self.artifactFiles(path), parameters)
+                    writers.append((getterName, 'Writing ' + label + ' to ' + formatName + ' (level of detail ' + str(level) + ')',
+                        self.frameWriter(getterName, self.geometryWriter(method, tolerance), path), failureMessage, False, artifact))
+
+        if self.exportOptions.get('geopackage', 0):
+            path = self.outputPath + '/' + str(self.studyRegion.name) + '.gpkg'
+            writers.append(('geopackage', 'Writing all layers to GeoPackage', self.writeGeoPackage,
+                'Unexpected error exporting the GeoPackage', True, (os.path.basename(path), [path], {'format': 'GeoPackage'})))
+        if self.exportOptions.get('geotiff', 0):
+            path = self.outputPath + '/hazard.tif'
+            artifact = (os.path.basename(path), [path], dict(self.hazardRaster, format='GeoTIFF'))
+            writers.append(('getHazardGeoDataFrame', 'Writing hazard to GeoTIFF', self.frameWriter('getHazardGeoDataFrame', self.writeHazardRaster, path),
+                'Hazard not available to export.', False, artifact))
+        if self.exportOptions.get('vectortiles', 0):
+            path = self.outputPath + '/' + str(self.studyRegion.name) + '.mbtiles'
+            writers.append(('vectortiles', 'Writing results and hazard to vector tiles', self.writeVectorTiles,
+                'Unexpected error exporting the vector tiles', True, (os.path.basename(path), [path], dict(self.vectorTiles, format='MBTiles'))))
+        if self.exportOptions.get('report', 0):
+            path = self.outputPath + '/report_summary.pdf'
+            parameters = {'format': 'PDF', 'title': self.reportTitle, 'subtitle': self.reportSubtitle, 'dpi': self.reportBuilder.draftDpi}
+            writers.append(('report', 'Writing results to PDF (exchanging patience for maps)', self.buildReport,
+                'Unexpected error exporting the PDF', True, (os.path.basename(path), [path], parameters)))
+        return writers
+
+    def artifactFiles(self, path):
+        """ returns the files a writer creates for an output path - shapefiles have sidecar files """
+        if not path.endswith('.shp'):
+            return [path]
+        return [path[0:-4] + extension for extension in ['.shp', '.shx', '.dbf', '.prj']]
+
+    def skipCurrentArtifacts(self, writers):
+        """ Drops the writers whose files are current in the export manifest
+
+            Returns:
+                writers: list -- the writers that still need to run
+        """
+        # an email-only export has no output directory, so there is nothing to track
+        if not self.incremental or not self.fileExportSelected():
+            return writers
+        self.manifest = ExportManifest(self.outputPath)
+        source = self.cache.sourceKey()
+        if source is None:
+            self.manifest = None
+            return writers
+        remaining = []
+        for writer in writers:
+            name, paths, parameters = writer[5]
+            if self.manifest.isCurrent(name, self.manifest.artifactKey(source, parameters)):
+                self.skipped.append(writer[1])
+            else:
+                remaining.append(writer)
+        if len(self.skipped) > 0:
+            print('Skipping {n} unchanged files'.format(n=len(self.skipped)))
+        return remaining
+
+    def recordArtifact(self, artifact):
+        """ records a written artifact in the export manifest """
+        if self.manifest is None:
+            return
+        name, paths, parameters = artifact
+        self.manifest.record(name, self.manifest.artifactKey(self.cache.sourceKey(), parameters),
+            [x for x in paths if os.path.exists(x)])
+
+    def saveManifest(self):
+        if self.manifest is None:
+            return
+        try:
+            self.manifest.save()
+        except:
+            print('Unable to save the export manifest: ' + str(sys.exc_info()[0]))
+
+    def requiredGetters(self, writers):
+        """ returns the names of the getters the writers read """
+        getterNames = set(writer[0] for writer in writers)
+        if 'geopackage' in getterNames:
+            getterNames.update(layer[0] for layer in self.layers)
+        if 'vectortiles' in getterNames:
+            getterNames.update(layer[0] for layer in self.layers if layer[4])
+        return getterNames
+
+    def addProgressUnits(self, steps, writers):
+        """ adds the steps and writers to the progress model - writers are weighted by the rows of the frames they write """
+        for message, function, failureMessage, showError, stage in steps:
+            self.progress.addUnit(message, stage)
+        for getterName, message, function, failureMessage, showError, artifact in writers:
+            if getterName == 'report':
+                self.progress.addUnit(message, 'report')
+            elif getterName == 'geopackage':
+                self.progress.addUnit(message, 'write', self.fetchedRows([layer[0] for layer in self.layers]))
+            elif getterName == 'vectortiles':
+                self.progress.addUnit(message, 'write', self.fetchedRows([layer[0] for layer in self.layers if layer[4]]))
+            else:
+                self.progress.addUnit(message, 'write', self.fetchedRows([getterName]))
+
+    def fetchedRows(self, getterNames):
+        """ returns a function counting the rows of the fetched frames, or returning None until one is fetched """
+        def rows():
+            fetched = [x for x in getterNames if self.cache.has(x)]
+            if len(fetched) == 0:
+                return None
+            return sum(len(getattr(self.cache, x)()) for x in fetched)
+        return rows
+
+    def frameWriter(self, getterName, write, path):
+        """ returns a function that writes a cached frame with write(frame, path) """
+        def writeFrame():
+            frame = getattr(self.cache, getterName)()
+            self.instrumentation.annotate(rows=len(frame))
+            write(frame, path)
+        return writeFrame
+
+    def geometryWriter(self, method, tolerance):
+        """ returns a write(frame, path) that writes the frame with its output geometry through a hazpy writer method """
+        def write(frame, path):
+            getattr(outputGeometry(frame, self.geometryPrecision, tolerance), method)(path)
+        return write
+
+    def writeCSV(self, frame, path):
+        """ writes a fetched frame to a CSV, reporting the rows written """
+        stats = writeCSV(frameChunks(frame, self.csvProgressRows), path, compress=self.csvGzip,
+            progress=lambda rows: self.progress.advance(rows, len(frame)))
+        self.csvStats[stats['path']] = stats
+
+    def writeHazardRaster(self, frame, path):
+        """ rasterizes the hazard polygons to a Cloud-Optimized GeoTIFF """
+        if 'geometry' not in frame.columns:
+            frame = frame.addGeometry()
+        writeHazardRaster(frame, path, workers=self.workers, progress=self.progress.advance, **self.hazardRaster)
+
+    def writeGeoPackage(self):
+        """ writes every available layer and damage table into one GeoPackage named after the study region """
+        frames = []
+        for getterName, label, fileName, failureMessage, spatial, csv in self.layers:
+            try:
+                frame = getattr(self.cache, getterName)()
+            except:
+                print(failureMessage)
+                continue
+            if spatial and 'geometry' not in frame.columns:
+                frame = frame.addGeometry()
+            frames.append((fileName, frame))
+        self.instrumentation.annotate(rows=sum(len(frame) for _, frame in frames))
+        writeGeoPackage(frames, self.outputPath + '/' + str(self.studyRegion.name) + '.gpkg', self.geopackageBatchSize,
+            progress=self.progress.advance)
+
+    def writeVectorTiles(self):
+        """ writes the spatial layers into one MBTiles vector tile archive named after the study region """
+        frames = []
+        for getterName, label, fileName, failureMessage, spatial, csv in self.layers:
+            if not spatial:
+                continue
+            try:
+                frame = getattr(self.cache, getterName)()
+            except:
+                print(failureMessage)
+                continue
+            if 'geometry' not in frame.columns:
+                frame = frame.addGeometry()
+            frames.append((fileName, frame))
+        self.instrumentation.annotate(rows=sum(len(frame) for _, frame in frames))
+        writeVectorTiles(frames, self.outputPath + '/' + str(self.studyRegion.name) + '.mbtiles', workers=self.workers,
+            progress=self.progress.advance, **self.vectorTiles)
+
+    def run(self):
+        """ runs the export stages, posting progress events - called on the worker thread """
+        t0 = time()
+        self.instrumentation.start()
+        self.progress.start()
+        status = 'failed'
+        try:
+            if self.fileExportSelected() and not os.path.exists(self.outputPath):
+                os.makedirs(self.outputPath)
+            writers = self.skipCurrentArtifacts(self.buildWriters())
+            if self.manifest is not None:
+                steps = self.buildSteps(self.requiredGetters(writers))
+            else:
+                steps = self.buildSteps()
+            self.addProgressUnits(steps, writers)
+
+            for step in steps:
+                if self.isCancelled():
+                    raise ExportCancelled()
+                self.runStep(*step)
+
+            self.runWriters(writers)
+            self.saveManifest()
+            if self.isCancelled():
+                raise ExportCancelled()
+
+            self.elapsedTime = time() - t0
+            status = 'complete'
+            self.events.put(('progress', (100, 'Complete', 0)))
+        except ExportCancelled:
+            self.elapsedTime = time() - t0
+            status = 'cancelled'
+        except:
+            self.elapsedTime = time() - t0
+            error = str(sys.exc_info()[0])
+        self.instrumentation.finish(status, skipped=len(self.skipped), writerErrors=len(self.writerErrors))
+        self.progress.saveHistory()
+        # the outcome is posted last, so the span log is complete once the caller sees it
+        if status == 'complete':
+            self.events.put(('complete', self.outputPath))
+        elif status == 'cancelled':
+            self.events.put(('cancelled', None))
+        else:
+            self.events.put(('failed', error))
+
+    def runStep(self, message, function, failureMessage, showError, stage='fetch', artifact=None):
+        """ runs a single step in an instrumentation span, records its time and reports its failure
+
+            Keyword Arguments: \n
+                stage: str -- the span stage (choices: 'email', 'fetch', 'write', 'report')
+                artifact: tuple -- the (name, paths, parameters) a writer produces; the bytes written are added to the span
+            Returns:
+                error: str -- the error if the step failed, otherwise None
+        """
+        self.progress.begin(message)
+        self.postProgress(message)
+        stepStart = time()
+        error = None
+        try:
+            with self.instrumentation.span(message, stage):
+                function()
+                if artifact is not None:
+                    name, paths, parameters = artifact
+                    self.instrumentation.annotate(artifact=name, format=parameters.get('format'),
+                        bytes=sum(os.path.getsize(x) for x in paths if os.path.exists(x)))
+        except ExportCancelled:
+            raise
+        except:
+            error = str(sys.exc_info()[0])
+            if showError:
+                self.events.put(('error', failureMessage + ': ' + error))
+            else:
+                print(failureMessage)
+        self.timings[message] = time() - stepStart
+        self.progress.finish(message)
+        return error
+
+    def runWriters(self, writers):
+        """ fans the fetched frames out to the format writers on a thread pool and reports all writer errors together """
+        groups = {}
+        for writer in writers:
+            groups.setdefault(writer[0], []).append(writer)
+
+        def runGroup(group):
+            for getterName, message, function, failureMessage, showError, artifact in group:
+                if self.isCancelled():
+                    return
+                # errors are reported once every writer has finished
+                error = self.runStep(message, function, failureMessage, False, 'report' if getterName == 'report' else 'write', artifact)
+                if error is not None:
+                    self.writerErrors.append((message, failureMessage, error, showError))
+                else:
+                    self.recordArtifact(artifact)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ExportWriter') as executor:
+            futures = [executor.submit(runGroup, group) for group in groups.values()]
+            for future in futures:
+                future.result()
+
+        # a missing optional layer is only printed; any other writer failure is shown in a single report
+        if any(showError for _, _, _, showError in self.writerErrors):
+            report = ['{m}: {e}'.format(m=message, e=error) for message, _, error, _ in self.writerErrors]
+            self.events.put(('error', u"Unexpected errors exporting:\n" + '\n'.join(report)))
+
+    def postProgress(self, message):
+        value, eta = self.progress.estimate()
+        self.events.put(('progress', (value, message, eta)))
+
+    def retrieveBaseResults(self):
+        """ retrieves the results and essential facilities shared by all output formats """
+        results = self.cache.getResults()
+        self.cache.getEssentialFacilities()
+        # check if the study region contains result data
+        if len(results) < 1:
+            self.events.put(('warning', 'No results found. Please check your study region and try again.'))
+
+    def buildReport(self):
+        if len(self.reportTitle) > 0:
+            self.studyRegion.report.title = self.reportTitle
+        if len(self.reportSubtitle) > 0:
+            self.studyRegion.report.subtitle = self.reportSubtitle
+        self.reportBuilder.build(self.studyRegion.report, self.cache, self.outputPath + '/report_summary.pdf',
+            progress=self.progress.advance)
+
+    def draftEmail(self):
+        # Outlook is driven through COM, which must be initialized on every thread that uses it
+        import pythoncom
+        from draftemail import draftEmail, getCountySummary
+        countySummary = self.cache.fetch('countySummary', lambda: getCountySummary(self.cache), persist=True)
+        pythoncom.CoInitialize()
+        try:
+            draftEmail(self.cache, countySummary=countySummary)
+        finally:
+            pythoncom.CoUninitialize()
@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import struct
+from datetime import datetime
+
+# GeoPackage 1.2 - application_id 'GPKG' and user_version 10200
+applicationId = 0x47504B47
+userVersion = 10200
+
+spatialReferenceSystems = [
+    ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', 'undefined cartesian coordinate reference system'),
+    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', 'undefined geographic coordinate reference system'),
+    ('WGS 84 geodetic', 4326, 'EPSG', 4326,
+     'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+     'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+     'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]',
+     'longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid')
+]
+
+
+def columnType(dtype):
+    """ returns the GeoPackage column type of a pandas dtype """
+    if dtype.kind == 'b':
+        return 'BOOLEAN'
+    if dtype.kind in 'iu':
+        return 'INTEGER'
+    if dtype.kind == 'f':
+        return 'DOUBLE'
+    if dtype.kind == 'M':
+        return 'DATETIME'
+    return 'TEXT'
+
+
+def sqlValue(value):
+    """ converts a pandas cell to a value sqlite can store """
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return sqlValue(value.item())
+    if isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def geometryBlob(geometry, srsId):
+    """ encodes a shapely geometry as a GeoPackage binary - a header with the xy envelope followed by WKB """
+    if geometry is None:
+        return None
+    if geometry.is_empty:
+        # empty flag, no envelope, little endian
+        return b'GP' + struct.pack('<BBi', 0, 0x11, srsId) + geometry.wkb
+    minx, miny, maxx, maxy = geometry.bounds
+    return b'GP' + struct.pack('<BBi4d', 0, 0x03, srsId, minx, maxx, miny, maxy) + geometry.wkb
+
+
+def createMetadataTables(cursor):
+    cursor.execute("""CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+        organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)""")
+    cursor.executemany('INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', spatialReferenceSystems)
+    cursor.execute("""CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+        identifier TEXT UNIQUE, description TEXT DEFAULT '',
+        last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+        min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+        CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))""")
+    cursor.execute("""CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+        geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+        CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+        CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+        CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))""")
+    cursor.execute("""CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+        definition TEXT NOT NULL, scope TEXT NOT NULL,
+        CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))""")
+
+
+def createSpatialIndex(cursor, table, bounds):
+    """ Builds the R*Tree spatial index of a feature table from the geometry envelopes in one bulk insert
+
+        The triggers that keep the index current are added afterwards, so GIS software can still edit the layer.
+    """
+    index = 'rtree_' + table + '_geom'
+    cursor.execute('CREATE VIRTUAL TABLE "{i}" USING rtree(id, minx, maxx, miny, maxy)'.format(i=index))
+    cursor.executemany('INSERT INTO "{i}" VALUES (?, ?, ?, ?, ?)'.format(i=index), bounds)
+    cursor.execute("""INSERT INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index',
+        'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')""", (table,))
+    # the trigger bodies use the ST_ functions GDAL and QGIS register on open
+    triggers = [
+        """CREATE TRIGGER "{i}_insert" AFTER INSERT ON "{t}" WHEN (new.geom NOT NULL AND NOT ST_IsEmpty(new.geom))
+        BEGIN INSERT OR REPLACE INTO "{i}" VALUES (new.fid, ST_MinX(new.geom), ST_MaxX(new.geom),
+        ST_MinY(new.geom), ST_MaxY(new.geom)); END""",
+        """CREATE TRIGGER "{i}_update" AFTER UPDATE OF geom ON "{t}" WHEN OLD.fid = NEW.fid
+        BEGIN DELETE FROM "{i}" WHERE id = OLD.fid; INSERT INTO "{i}" SELECT NEW.fid, ST_MinX(NEW.geom),
+        ST_MaxX(NEW.geom), ST_MinY(NEW.geom), ST_MaxY(NEW.geom)
+        WHERE NEW.geom NOT NULL AND NOT ST_IsEmpty(NEW.geom); END""",
+        """CREATE TRIGGER "{i}_delete" AFTER DELETE ON "{t}" WHEN old.geom NOT NULL
+        BEGIN DELETE FROM "{i}" WHERE id = OLD.fid; END"""
+    ]
+    for trigger in triggers:
+        cursor.execute(trigger.format(i=index, t=table))
+
+
+def writeLayer(cursor, table, df, batchSize=10000, srsId=4326, progress=None):
+    """ Writes a dataframe as a GeoPackage table - a feature table if it has a geometry column, otherwise an attribute table
+
+        Keyword Arguments: \n
+            cursor: sqlite3 cursor -- a cursor inside the open transaction
+            table: str -- the table name
+            df: pandas dataframe -- the frame to write; geometries may be shapely objects or WKT
+            batchSize: int -- the number of rows sent to sqlite per executemany call
+            srsId: int -- the spatial reference of the geometries
+            progress: function -- optional progress(rows) called with the rows inserted after every batch
+    """
+    from shapely.wkt import loads
+
+    spatial = 'geometry' in df.columns
+    columns = [x for x in df.columns if x != 'geometry']
+    definitions = ['fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL']
+    if spatial:
+        definitions.append('geom GEOMETRY')
+    definitions += ['"{c}" {t}'.format(c=str(column).replace('"', '""'), t=columnType(df[column].dtype)) for column in columns]
+    cursor.execute('CREATE TABLE "{t}" ({d})'.format(t=table, d=', '.join(definitions)))
+
+    names = ['fid'] + (['geom'] if spatial else []) + ['"{c}"'.format(c=str(x).replace('"', '""')) for x in columns]
+    insert = 'INSERT INTO "{t}" ({n}) VALUES ({p})'.format(t=table, n=', '.join(names), p=', '.join(['?'] * len(names)))
+    values = df[columns].astype(object).values
+    geometries = df['geometry'].values if spatial else None
+    bounds = []
+    extent = None
+    for start in range(0, len(df), batchSize):
+        rows = []
+        for offset in range(start, min(start + batchSize, len(df))):
+            fid = offset + 1
+            row = [fid]
+            if spatial:
+                geometry = geometries[offset]
+                if geometry is not None and not hasattr(geometry, 'wkb'):
+                    geometry = loads(str(geometry)) if str(geometry) not in ['', 'nan', 'None'] else None
+                row.append(geometryBlob(geometry, srsId))
+                if geometry is not None and not geometry.is_empty:
+                    minx, miny, maxx, maxy = geometry.bounds
+                    bounds.append((fid, minx, maxx, miny, maxy))
+                    if extent is None:
+                        extent = [minx, miny, maxx, maxy]
+                    else:
+                        extent = [min(extent[0], minx), min(extent[1], miny), max(extent[2], maxx), max(extent[3], maxy)]
+            row += [sqlValue(x) for x in values[offset]]
+            rows.append(row)
+        cursor.executemany(insert, rows)
+        if progress is not None:
+            progress(start + len(rows))
+
+    if spatial:
+        extent = extent or [None] * 4
+        cursor.execute("""INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id)
+            VALUES (?, 'features', ?, ?, ?, ?, ?, ?)""", [table, table] + extent + [srsId])
+        cursor.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 'GEOMETRY', ?, 0, 0)", (table, srsId))
+        createSpatialIndex(cursor, table, bounds)
+    else:
+        cursor.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier) VALUES (?, 'attributes', ?)", (table, table))
+
+
+def writeGeoPackage(layers, path, batchSize=10000, progress=None):
+    """ Writes several layers and tables into a single GeoPackage in one transaction
+
+        The file is built next to the output path and moved into place once committed, so a reader
+        never sees a partial GeoPackage.
+
+        Keyword Arguments: \n
+            layers: list -- (tableName, dataframe) tuples; frames with a geometry column become feature tables with a spatial index
+            path: str -- the output path (example: 'C:/directory/export.gpkg')
+            batchSize: int -- the number of rows sent to sqlite per executemany call
+            progress: function -- optional progress(rows, totalRows) called with the rows inserted in all layers after every batch
+    """
+    totalRows = sum(len(df) for _, df in layers)
+    temporaryPath = path + '.tmp'
+    if os.path.exists(temporaryPath):
+        os.remove(temporaryPath)
+    conn = sqlite3.connect(temporaryPath, isolation_level=None)
+    try:
+        conn.execute('PRAGMA application_id = {a}'.format(a=applicationId))
+        conn.execute('PRAGMA user_version = {v}'.format(v=userVersion))
+        # the temp file is discarded on failure, so the rollback journal is not needed
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        createMetadataTables(cursor)
+        written = 0
+        for table, df in layers:
+            layerProgress = None
+            if progress is not None:
+                layerProgress = lambda rows, written=written: progress(written + rows, totalRows)
+            writeLayer(cursor, table, df, batchSize, progress=layerProgress)
+            written += len(df)
+        cursor.execute('COMMIT')
+    except:
+        conn.close()
+        os.remove(temporaryPath)
+        raise
+    conn.close()
+    os.replace(temporaryPath, path)
@@ -1,7 +1,15 @@
+# startup timing starts before any import
+from time import time
+startupStart = time()
+
 import ctypes
 import sys
-from hazpy.legacy import StudyRegion, HazusDB
-from draftemail import draftEmail
+from connectionpool import ConnectionPools, pooledClass
+from exportjob import ExportJob
+from reportbuilder import ReportBuilder
+from resultcache import ResultCache
+from metadata import StudyRegionMetadata, studyRegionLabel
+from progress import formatEta
 import os
 import tkinter as tk
 from tkinter import messagebox
@@ -16,8 +24,10 @@ from tkinter.ttk import Progressbar
 from tkinter import TOP, RIGHT, LEFT, BOTTOM
 from tkinter import N, S, E, W
 from PIL import ImageTk, Image
-from time import time, sleep
+from time import sleep
 import json
+import queue
+import concurrent.futures
 
 
 class App():
@@ -30,6 +40,9 @@ class App():
         # load config
         self.config = json.loads(open('src/config.json').read())
 
+        # startup instrumentation - seconds since launch, keyed by stage
+        self.startupTimes = {'imports': time() - startupStart}
+
         # global styles
         self.globalStyles = self.config['themes'][self.config['activeTheme']]
         self.backgroundColor = self.globalStyles['backgroundColor']
@@ -67,10 +80,51 @@ class App():
         # Init dynamic row
         self.row = 0
 
-    def updateProgressBar(self, value, message):
-        """ Updates the progress bar text and position when processing
+        # background export
+        self.exportJob = None
+        self.pollInterval = 100  # in milliseconds
+        # StudyRegions and the HazusDB lease their connections from a pool per class and database
+        self.connectionPools = ConnectionPools(**self.config['database'])
+        self.metadata = StudyRegionMetadata(self.createStudyRegion, self.createHazusDB, ttl=self.config['metadata']['cacheTtl'])
+        # the study region dropdown shows labels with the prefetched hazards and size, keyed to the names
+        self.studyRegionNames = {}
+        self.studyRegionLabels = {}
+        self.resultCache = ResultCache(self.config['export']['resultCacheDirectory'], enabled=self.config['export']['resultCache'])
+        self.reportBuilder = ReportBuilder(self.config['report']['cacheDirectory'], self.config['report']['draftDpi'],
+                                           self.config[self.config['release']]['httpTimeout'])
+
+    def createStudyRegion(self, name):
+        """ imports hazpy on first use so the window does not wait on it """
+        from hazpy.legacy import StudyRegion
+        return pooledClass(StudyRegion, self.connectionPools)(name)
+
+    def createHazusDB(self):
+        from hazpy.legacy import HazusDB
+        return pooledClass(HazusDB, self.connectionPools)()
+
+    def recordStartup(self, stage):
+        """ records the seconds since launch for a startup stage and reports them once the app is ready
+        """
+        self.startupTimes[stage] = time() - startupStart
+        if 'window' in self.startupTimes and 'studyRegions' in self.startupTimes:
+            print('Startup time: ' + ', '.join(['{k} {v:.2f}s'.format(k=k, v=v) for k, v in self.startupTimes.items()]))
+            try:
+                logPath = self.config['startup']['logPath']
+                os.makedirs(os.path.dirname(logPath), exist_ok=True)
+                with open(logPath, 'a') as log:
+                    log.write(json.dumps(dict(self.startupTimes, fastStart=self.config['startup']['fastStart'], started=startupStart)) + '\n')
+            except:
+                print('unable to write the startup log')
+
+    def updateProgressBar(self, value, message=None, eta=None):
+        """ Updates the progress bar text and position when processing - the last message is kept if None
         """
-        self.label_progress.config(text=message)
+        if message is not None:
+            self.progressMessage = message
+        text = self.progressMessage
+        if eta is not None:
+            text = text + ' - ' + formatEta(eta)
+        self.label_progress.config(text=text)
         self.root.update_idletasks()
         self.bar_progress['value'] = value
 
@@ -80,9 +134,9 @@ class App():
         self.outputDirectory = filedialog.askdirectory()
         self.outputDirectory = self.outputDirectory.replace('\n', '')
         self.text_outputDirectory.delete("1.0", 'end-1c')
-        if len(self.dropdown_studyRegion.get()) > 0:
+        if len(self.selectedStudyRegion()) > 0:
             self.text_outputDirectory.insert(
-                "1.0", self.outputDirectory + '/' + self.dropdown_studyRegion.get())
+                "1.0", self.outputDirectory + '/' + self.selectedStudyRegion())
             self.root.update_idletasks()
         else:
             self.text_outputDirectory.insert("1.0", self.outputDirectory)
@@ -114,11 +168,12 @@ class App():
         self.button_run['background'] = '#0078a9'
 
     def run(self):
-        """ runs the export with all the user parameters selected
+        """ validates the user parameters and starts the export on a background worker
         """
         try:
-            # init time
-            t0 = time()
+            # only one export can run at a time
+            if self.exportJob is not None and self.exportJob.isRunning():
+                return None
 
             # make sure all options are selected and get all info
             if not self.validateRequiredFields():
@@ -126,182 +181,102 @@ class App():
                     None, u"Please select these required fields prior to exporting: {e}".format(e=self.selection_errors), u'HazPy - Message', 0)
                 return None
 
-            # (extra) draft email if the checkbox is selected
-            try:
-                if 'opt_draftEmail' in dir(self):
-                    if self.exportOptions['draftEmail']:
-                        draftEmail(self.studyRegion)
-                    # return if only draftEmail is checked
-                    if self.exportOptions['csv'] + self.exportOptions['shapefile'] + self.exportOptions['geojson'] + self.exportOptions['report'] == 0:
-                        tk.messagebox.showinfo("HazPy", "Complete - Draft email can be found in the draft folder of Outlook")
-                        return
-            except:
-                print('unable to draft email')
-
-            # add progress bar
-            self.addWidget_progress()
-
-            # calculate progress bar increments
-            exportOptionsCount = 0
-            if self.exportOptions['csv']:
-                exportOptionsCount += 4
-            if self.exportOptions['shapefile']:
-                exportOptionsCount += 3
-            if self.exportOptions['geojson']:
-                exportOptionsCount += 3
-            if self.exportOptions['report']:
-                exportOptionsCount += 2
-            progressIncrement = 100 / exportOptionsCount
-            progressValue = 0
-            
-            # create a directory for the output files
+            # read every widget value here - the worker thread must not touch tkinter
             outputPath = self.text_outputDirectory.get("1.0",'end')
             outputPath = outputPath.replace('\n', '')
-            if not os.path.exists(outputPath):
-                os.mkdir(outputPath)
-
-            # get bulk of results
-            try:
-                progressValue = progressValue + progressIncrement
-                msg = 'Retrieving base results'
-                self.updateProgressBar(progressValue, msg)
-                results = self.studyRegion.getResults()
-                essentialFacilities = self.studyRegion.getEssentialFacilities()
-
-                # check if the study region contains result data
-                if len(results) < 1:
-                    tk.messagebox.showwarning(
-                        'HazPy', 'No results found. Please check your study region and try again.')
-            except:
-                ctypes.windll.user32.MessageBoxW(None, u"Unexpected error retrieving base results: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
-
-            # export study region to csv if the checkbox is selected
-            if self.exportOptions['csv']:
-                try:
-                    progressValue = progressValue + progressIncrement
-                    self.updateProgressBar(progressValue, 'Writing results to CSV')
-                    try:
-                        results.toCSV(outputPath + '/results.csv')
-                    except:
-                        print('Base results not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing building damage by occupancy to CSV')
-                        buildingDamageByOccupancy = self.studyRegion.getBuildingDamageByOccupancy()
-                        buildingDamageByOccupancy.toCSV(outputPath + '/building_damage_by_occupancy.csv')
-                    except:
-                        print('Building damage by occupancy not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing building damage by type to CSV')
-                        buildingDamageByType = self.studyRegion.getBuildingDamageByType()
-                        buildingDamageByType.toCSV(outputPath + '/building_damage_by_type.csv')
-                    except:
-                        print('Building damage by type not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing damaged facilities to CSV')
-                        essentialFacilities.toCSV(outputPath + '/damaged_facilities.csv')
-                    except:
-                        print('Damaged facilities not available to export.')
-                except:
-                    ctypes.windll.user32.MessageBoxW(
-                        None, u"Unexpected error exporting CSVs: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
-
-            # export study region to Shapefile if the checkbox is selected
-            if self.exportOptions['shapefile']:
-                try:
-                    progressValue = progressValue + progressIncrement
-                    self.updateProgressBar(progressValue, 'Writing results to Shapefile')
-                    try:
-                        results.toShapefile(
-                            outputPath + '/results.shp')
-                    except:
-                        print('Base results not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing damaged facilities to Shapefile')
-                        essentialFacilities.toShapefile(
-                            outputPath + '/damaged_facilities.shp')
-                    except:
-                        print('Damaged facilities not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing hazard to Shapefile')
-                        if not 'hazard' in dir():
-                            hazard = self.studyRegion.getHazardGeoDataFrame()
-                        hazard.toShapefile(
-                            outputPath + '/hazard.shp')
-                    except:
-                        print('Hazard not available to export.')
-                except:
-                    ctypes.windll.user32.MessageBoxW(
-                        None, u"Unexpected error exporting Shapefile: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
-
-            # export study region to GeoJSON if the checkbox is selected
-            if self.exportOptions['geojson']:
-                try:
-                    progressValue = progressValue + progressIncrement
-                    msg = 'Writing results to GeoJSON'
-                    self.updateProgressBar(progressValue, msg)
-                    try:
-                        results.toGeoJSON(
-                            outputPath + '/results.geojson')
-                    except:
-                        print('Base results not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing damaged facilities to GeoJSON')
-                        essentialFacilities.toGeoJSON(
-                            outputPath + '/damaged_facilities.geojson')
-                    except:
-                        print('Damaged facilities not available to export.')
-                    try:
-                        progressValue = progressValue + progressIncrement
-                        self.updateProgressBar(progressValue, 'Writing hazard to GeoJSON')
-                        if not 'hazard' in dir():
-                            hazard = self.studyRegion.getHazardGeoDataFrame()
-                        hazard.toGeoJSON(
-                            outputPath + '/hazard.geojson')
-                    except:
-                        print('Hazard not available to export.')
-                except:
-                    ctypes.windll.user32.MessageBoxW(
-                        None, u"Unexpected error exporting GeoJSON: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
-
-            # export study region to pdf if the checkbox is selected
+            reportTitle = ''
+            reportSubtitle = ''
             if self.exportOptions['report']:
-                try:
-                    progressValue = progressValue + progressIncrement
-                    msg = 'Writing results to PDF (exchanging patience for maps)'
-                    self.updateProgressBar(progressValue, msg)
-                    reportTitle = self.text_reportTitle.get("1.0", 'end-1c')
-                    if len(reportTitle) > 0:
-                        self.studyRegion.report.title = reportTitle
-                    reportSubtitle = self.text_reportSubtitle.get("1.0", 'end-1c')
-                    if len(reportSubtitle) > 0:
-                        self.studyRegion.report.subtitle = reportSubtitle
-                    self.studyRegion.report.save(outputPath + '/report_summary.pdf', build=True)
-                except:
-                    ctypes.windll.user32.MessageBoxW(
-                        None, u"Unexpected error exporting the PDF: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
-
-            # show export is complete
-            self.updateProgressBar(100, 'Complete')
-            print('Results available at: ' + outputPath)
-            print('Total elapsed time: ' + str(time() - t0))
-            tk.messagebox.showinfo("HazPy", "Complete - Output files can be found at: " +
-                                outputPath)
-            self.removeWidget_progress()
+                reportTitle = self.text_reportTitle.get("1.0", 'end-1c')
+                reportSubtitle = self.text_reportSubtitle.get("1.0", 'end-1c')
+
+            self.exportJob = ExportJob(self.studyRegion, outputPath, self.exportOptions, reportTitle, reportSubtitle,
+                                       workers=self.config['export']['writerWorkers'], resultCache=self.resultCache,
+                                       csvProgressRows=self.config['export']['csvProgressRows'], csvGzip=self.config['export']['csvGzip'],
+                                       parquetCompression=self.config['export']['parquetCompression'], tableFormat=self.config['export']['tableFormat'],
+                                       geopackageBatchSize=self.config['export']['geopackageBatchSize'], incremental=self.config['export']['incremental'],
+                                       reportBuilder=self.reportBuilder, spanLog=self.config['instrumentation']['spanLog'],
+                                       profileDirectory=self.config['instrumentation']['profileDirectory'],
+                                       traceMemory=self.config['instrumentation']['traceMemory'],
+                                       progressHistory=self.config['export']['progressHistory'],
+                                       geometryPrecision=self.config['export']['geometryPrecision'],
+                                       simplifyTolerance=self.config['export']['simplifyTolerance'],
+                                       levelsOfDetail=self.config['export']['levelsOfDetail'],
+                                       vectorTiles=self.config['export']['vectorTiles'],
+                                       hazardRaster=self.config['export']['hazardRaster'])
 
+            # add progress bar
+            self.addWidget_progress()
+            self.button_run.config(state='disabled')
+            self.exportJob.start()
+            self.root.after(self.pollInterval, self.pollExportJob)
 
         except:
             # if the export fails
             if 'bar_progress' in dir(self):
                 self.removeWidget_progress()
+            self.button_run.config(state='normal')
             ctypes.windll.user32.MessageBoxW(
                 None, u"Unexpected export error: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
-    
+
+    def cancel(self):
+        """ asks the running export to stop after its current step
+        """
+        if self.exportJob is not None and self.exportJob.isRunning():
+            self.exportJob.cancel()
+            self.label_progress.config(text='Cancelling - waiting for the current step to finish')
+            self.button_cancel.config(state='disabled')
+
+    def pollExportJob(self):
+        """ handles the events posted by the export worker and reschedules itself until the job ends
+        """
+        job = self.exportJob
+        finished = False
+        try:
+            while True:
+                kind, payload = job.events.get_nowait()
+                if kind == 'progress':
+                    self.updateProgressBar(*payload)
+                elif kind == 'warning':
+                    tk.messagebox.showwarning('HazPy', payload)
+                elif kind == 'error':
+                    ctypes.windll.user32.MessageBoxW(None, payload, u'HazPy - Message', 0)
+                else:
+                    finished = True
+                    self.finishExportJob(kind, payload)
+                    break
+        except queue.Empty:
+            pass
+        if not finished:
+            # the bar and time left move with the work reported inside long steps, between step events
+            if not job.isCancelled():
+                value, eta = job.progress.estimate()
+                self.updateProgressBar(value, eta=eta)
+            self.root.after(self.pollInterval, self.pollExportJob)
+
+    def finishExportJob(self, kind, payload):
+        """ reports the outcome of the export job and resets the progress widgets
+        """
+        job = self.exportJob
+        for message, seconds in job.timings.items():
+            print('{m}: {s:.2f}s'.format(m=message, s=seconds))
+        for message in job.skipped:
+            print('Unchanged, skipped: ' + message)
+        print('Total elapsed time: ' + str(job.elapsedTime))
+        self.removeWidget_progress()
+        self.button_run.config(state='normal')
+        if kind == 'complete':
+            if job.fileExportSelected():
+                print('Results available at: ' + payload)
+                tk.messagebox.showinfo("HazPy", "Complete - Output files can be found at: " + payload)
+            else:
+                tk.messagebox.showinfo("HazPy", "Complete - Draft email can be found in the draft folder of Outlook")
+        elif kind == 'cancelled':
+            tk.messagebox.showinfo("HazPy", "Export cancelled")
+        else:
+            ctypes.windll.user32.MessageBoxW(
+                None, u"Unexpected export error: " + payload, u'HazPy - Message', 0)
+
     def validateRequiredFields(self):
         """ checks that the user has completed all required fields
         """
@@ -314,9 +289,9 @@ class App():
             # validate dropdown menus
             # validates that a study region is selected
             if self.dropdown_studyRegion.winfo_ismapped():
-                value = self.dropdown_studyRegion.get()
+                value = self.selectedStudyRegion()
                 if len(value) > 0:
-                    self.studyRegion = StudyRegion(str(value))
+                    self.studyRegion = self.createStudyRegion(str(value))
                 else:
                     self.selection_errors.append('Study Region')
                     validated = False
@@ -353,6 +328,10 @@ class App():
             self.exportOptions['csv'] = self.opt_csv.get()
             self.exportOptions['shapefile'] = self.opt_shp.get()
             self.exportOptions['geojson'] = self.opt_geojson.get()
+            self.exportOptions['parquet'] = self.opt_parquet.get()
+            self.exportOptions['geopackage'] = self.opt_geopackage.get()
+            self.exportOptions['vectortiles'] = self.opt_vectortiles.get()
+            self.exportOptions['geotiff'] = self.opt_geotiff.get()
             self.exportOptions['report'] = self.opt_report.get()
 
             # validates if the sum is greater than zero - if selected, they each checkbox will have a value of 1
@@ -522,8 +501,11 @@ class App():
         """adds the progress bar widget"""
         row = self.row_progress
 
-        self.bar_progress = Progressbar(mode='indeterminate')
+        self.bar_progress = Progressbar(mode='determinate', maximum=100)
         self.bar_progress.grid(row=row, column=1, pady=(0, 10), padx=50, sticky='nsew')
+        self.button_cancel = tk.Button(self.root, text='Cancel', command=self.cancel, relief='flat',
+                                       background=self.backgroundColor, fg=self.fontColor, cursor="hand2", font='Helvetica 8')
+        self.button_cancel.grid(row=row, column=2, padx=(0, self.padl), pady=(0, 10), sticky=W)
         self.root.update_idletasks()
         row += 1
         self.label_progress = tk.Label(
@@ -533,6 +515,7 @@ class App():
         row += 1
         self.label_progress.config(
             text='Initializing')
+        self.progressMessage = 'Initializing'
         self.bar_progress['value'] = 0
         self.root.update_idletasks()
         self.root.update()
@@ -540,21 +523,22 @@ class App():
     def removeWidget_progress(self):
         """removes the progress bar widget"""
         self.bar_progress.grid_forget()
+        self.button_cancel.grid_forget()
         self.label_progress.grid_forget()
 
+    def whenDone(self, future, callback):
+        """calls callback(future) on the tkinter thread once a background future has finished"""
+        if future.done():
+            callback(future)
+        else:
+            self.root.after(self.pollInterval, lambda: self.whenDone(future, callback))
+
     def handle_studyRegion(self, name, index, operation):
-        """handles widget creation and removal and initializes the study region class based off the study region dropdown selection"""
+        """handles widget creation and removal and loads the study region metadata in the background based off the study region dropdown selection"""
         try:
-            value = self.value_studyRegion.get()
+            value = self.selectedStudyRegion()
             # if a study region is selected
             if value != '':
-                # init StudyRegion class
-                self.studyRegion = StudyRegion(str(value))
-                # get lists of hazards, scenarios, and return periods
-                self.options_hazard = self.studyRegion.getHazardsAnalyzed()
-                self.options_scenario = self.studyRegion.getScenarios()
-                self.options_returnPeriod = self.studyRegion.getReturnPeriods()
-
                 # try to remove previous widgets if they exist
                 try:
                     self.removeWidget_hazard()
@@ -569,19 +553,41 @@ class App():
                 except:
                     pass
 
-                # add widgets if multiple options exist
-                if len(self.options_hazard) > 1:
-                    self.addWidget_hazard(self.row_hazard)
-                if len(self.options_scenario) > 1:
-                    self.addWidget_scenario(self.row_scenario)
-                if len(self.options_returnPeriod) > 1:
-                    self.addWidget_returnPeriod(self.row_returnPeriod)
-
-                # update the output directory
-                if len(self.text_outputDirectory.get("1.0", 'end-1c')) > 0:
-                    self.text_outputDirectory.delete("1.0", 'end-1c')
-                    self.text_outputDirectory.insert(
-                        "1.0", self.outputDirectory + '/' + self.studyRegion.name)
+                # get lists of hazards, scenarios, and return periods without blocking the window
+                self.label_studyRegion.config(text='Study Region (loading...)')
+                future = self.metadata.getMetadata(str(value))
+                self.whenDone(future, lambda future: self.handle_studyRegionLoaded(value, future))
+        except:
+            ctypes.windll.user32.MessageBoxW(
+                None, u"Unable to initialize the Study Region. Please select another Study Region to continue. Error: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
+
+    def handle_studyRegionLoaded(self, value, future):
+        """adds the hazard, scenario, and return period widgets once the study region metadata has loaded"""
+        # ignore the result if another study region was selected while loading
+        if value != self.selectedStudyRegion():
+            return
+        self.label_studyRegion.config(text='Study Region')
+        try:
+            metadata = future.result()
+            # init StudyRegion class
+            self.studyRegion = metadata['studyRegion']
+            self.options_hazard = metadata['hazards']
+            self.options_scenario = metadata['scenarios']
+            self.options_returnPeriod = metadata['returnPeriods']
+
+            # add widgets if multiple options exist
+            if len(self.options_hazard) > 1:
+                self.addWidget_hazard(self.row_hazard)
+            if len(self.options_scenario) > 1:
+                self.addWidget_scenario(self.row_scenario)
+            if len(self.options_returnPeriod) > 1:
+                self.addWidget_returnPeriod(self.row_returnPeriod)
+
+            # update the output directory
+            if len(self.text_outputDirectory.get("1.0", 'end-1c')) > 0:
+                self.text_outputDirectory.delete("1.0", 'end-1c')
+                self.text_outputDirectory.insert(
+                    "1.0", self.outputDirectory + '/' + self.studyRegion.name)
         except:
             ctypes.windll.user32.MessageBoxW(
                 None, u"Unable to initialize the Study Region. Please select another Study Region to continue. Error: " + str(sys.exc_info()[0]), u'HazPy - Message', 0)
@@ -591,48 +597,63 @@ class App():
         value = self.value_hazard.get()
         # if value selected
         if value != '':
-            # update study region class with value
-            self.studyRegion.setHazard(value)
             print('Hazard set as ' + str(value))
-
             # get new scenario list
-            self.options_scenario = self.studyRegion.getScenarios()
-            # remove previous scenario widget if exists
-            try:
-                self.removeWidget_scenario()
-            except:
-                pass
-            # add scenario widget if more than one option exists
-            if len(self.options_scenario) > 1:
-                self.addWidget_scenario()
-    
+            future = self.metadata.getScenarios(self.selectedStudyRegion(), value)
+            self.whenDone(future, lambda future: self.handle_scenariosLoaded(value, future))
+
+    def handle_scenariosLoaded(self, hazard, future):
+        """replaces the scenario widget once the scenarios of the selected hazard have loaded"""
+        if hazard != self.value_hazard.get():
+            return
+        try:
+            self.options_scenario = future.result()
+        except:
+            print('Unable to get the scenarios for ' + str(hazard))
+            return
+        # remove previous scenario widget if exists
+        try:
+            self.removeWidget_scenario()
+        except:
+            pass
+        # add scenario widget if more than one option exists
+        if len(self.options_scenario) > 1:
+            self.addWidget_scenario(self.row_scenario)
+
     def handle_scenario(self, name, index, operation):
         """handles the selection of a scenario from the scenario widget"""
         value = self.value_scenario.get()
         # if value selected
         if value != '':
-            # update study region class with value
-            self.studyRegion.setScenario(value)
             print('Scenario set as ' + str(value))
-
             # get new return period list
-            self.options_returnPeriod = self.studyRegion.getReturnPeriods()
-            # remove previous return period widget if exists
-            try:
-                self.removeWidget_returnPeriod()
-            except:
-                pass
-            # add return period widget if more than one option exists
-            if len(self.options_returnPeriod) > 1:
-                self.addWidget_returnPeriod()
+            hazard = self.value_hazard.get() or None
+            future = self.metadata.getReturnPeriods(self.selectedStudyRegion(), hazard, value)
+            self.whenDone(future, lambda future: self.handle_returnPeriodsLoaded(value, future))
+
+    def handle_returnPeriodsLoaded(self, scenario, future):
+        """replaces the return period widget once the return periods of the selected scenario have loaded"""
+        if scenario != self.value_scenario.get():
+            return
+        try:
+            self.options_returnPeriod = future.result()
+        except:
+            print('Unable to get the return periods for ' + str(scenario))
+            return
+        # remove previous return period widget if exists
+        try:
+            self.removeWidget_returnPeriod()
+        except:
+            pass
+        # add return period widget if more than one option exists
+        if len(self.options_returnPeriod) > 1:
+            self.addWidget_returnPeriod(self.row_returnPeriod)
 
     def handle_returnPeriod(self, name, index, operation):
         """handles the selection of a return period from the return period widget"""
         value = self.value_returnPeriod.get()
-        # if value exists
+        # if value exists - it is applied to the export study region in validateRequiredFields
         if value != '':
-            # update study region class with value
-            self.studyRegion.setReturnPeriod(value)
             print('Return Period set as ' + str(value))
         
 
@@ -640,8 +661,7 @@ class App():
         """ builds the GUI
         """
         try:
-            # initialize dropdown options
-            options_studyRegion = HazusDB().getStudyRegions()
+            # initialize dropdown options - the study regions are filled in by loadStudyRegions
             self.value_studyRegion = StringVar(name='studyRegion')
             self.value_studyRegion.trace('w', self.handle_studyRegion)
 
@@ -670,7 +690,7 @@ class App():
             self.row += 1
             # Study Region dropdown
             self.dropdown_studyRegion = ttk.Combobox(
-                self.root, textvar=self.value_studyRegion, values=options_studyRegion, width=40, style='H.TCombobox')
+                self.root, textvar=self.value_studyRegion, values=[], width=40, style='H.TCombobox')
             self.dropdown_studyRegion.grid(row=self.row, column=1,
                                 padx=(0, 0), pady=(0, 0), sticky=W)
             # Study Region icon
@@ -709,6 +729,26 @@ class App():
             ttk.Checkbutton(self.root, text="GeoJSON", variable=self.opt_geojson, style='BW.TCheckbutton').grid(
                 row=self.row, column=1, padx=(xpadl, 0), pady=0, sticky=W)
             self.row += 1
+            # geoparquet
+            self.opt_parquet = tk.IntVar(value=0)
+            ttk.Checkbutton(self.root, text="GeoParquet", variable=self.opt_parquet, style='BW.TCheckbutton').grid(
+                row=self.row, column=1, padx=(xpadl, 0), pady=0, sticky=W)
+            self.row += 1
+            # geopackage
+            self.opt_geopackage = tk.IntVar(value=0)
+            ttk.Checkbutton(self.root, text="GeoPackage", variable=self.opt_geopackage, style='BW.TCheckbutton').grid(
+                row=self.row, column=1, padx=(xpadl, 0), pady=0, sticky=W)
+            self.row += 1
+            # vector tiles
+            self.opt_vectortiles = tk.IntVar(value=0)
+            ttk.Checkbutton(self.root, text="Vector Tiles (MBTiles)", variable=self.opt_vectortiles, style='BW.TCheckbutton').grid(
+                row=self.row, column=1, padx=(xpadl, 0), pady=0, sticky=W)
+            self.row += 1
+            # hazard raster
+            self.opt_geotiff = tk.IntVar(value=0)
+            ttk.Checkbutton(self.root, text="Hazard GeoTIFF (COG)", variable=self.opt_geotiff, style='BW.TCheckbutton').grid(
+                row=self.row, column=1, padx=(xpadl, 0), pady=0, sticky=W)
+            self.row += 1
             # report
             self.opt_report = tk.IntVar(value=1)
             ttk.Checkbutton(self.root, text="Report", variable=self.opt_report, style='BW.TCheckbutton', command=self.handle_reportCheckbox).grid(
@@ -782,10 +822,65 @@ class App():
             self.text_reportSubtitle.bind('<Shift-Tab>', self.focus_previous_widget)
             self.text_outputDirectory.bind('<Shift-Tab>', self.focus_previous_widget)
 
+            # fill the study region dropdown
+            self.loadStudyRegions()
+
         except:
             messageBox = ctypes.windll.user32.MessageBoxW
             messageBox(0, "Unable to build the app: " + str(sys.exc_info()[0]) + " | If this problem persists, contact hazus-support@riskmapcds.com.", "HazPy", 0x1000)
 
+    def loadStudyRegions(self):
+        """ queries the study regions in the background and fills the study region dropdown when they arrive
+        """
+        self.label_studyRegion.config(text='Study Region (loading...)')
+        future = self.metadata.getStudyRegions()
+        if not self.config['startup']['fastStart']:
+            # wait for the study regions before the window opens
+            concurrent.futures.wait([future])
+        self.whenDone(future, self.handle_studyRegionsLoaded)
+
+    def handle_studyRegionsLoaded(self, future):
+        """fills the study region dropdown and starts the metadata prefetch"""
+        self.label_studyRegion.config(text='Study Region')
+        try:
+            names = list(future.result())
+            self.studyRegionNames = {name: name for name in names}
+            self.dropdown_studyRegion.config(values=names)
+            self.recordStartup('studyRegions')
+            if self.config['metadata']['prefetch']:
+                futures = self.metadata.prefetch(names, self.config['metadata']['prefetchWorkers'])
+                self.root.after(self.pollInterval, lambda: self.pollPrefetch(names, futures))
+        except:
+            messageBox = ctypes.windll.user32.MessageBoxW
+            messageBox(0, "Unable to get the study regions: " + str(sys.exc_info()[0]) + " | If this problem persists, contact hazus-support@riskmapcds.com.", "HazPy", 0x1000)
+
+    def pollPrefetch(self, names, futures):
+        """labels the study regions in the dropdown with their hazards and size as the prefetch loads them"""
+        pending = []
+        updated = False
+        for future in futures:
+            if not future.done():
+                pending.append(future)
+                continue
+            try:
+                name, summary = future.result()
+            except:
+                # the region is loaded again when it is selected and reports its error then
+                continue
+            label = studyRegionLabel(name, summary)
+            self.studyRegionNames[label] = name
+            self.studyRegionLabels[name] = label
+            updated = True
+        if updated:
+            self.dropdown_studyRegion.config(values=[self.studyRegionLabels.get(name, name) for name in names])
+        if len(pending) > 0:
+            self.root.after(self.pollInterval * 5, lambda: self.pollPrefetch(names, pending))
+
+    def selectedStudyRegion(self):
+        """returns the name of the study region selected in the dropdown"""
+        value = self.value_studyRegion.get()
+        return self.studyRegionNames.get(value, value)
+
     def centerApp(self):
         try:
             screenWidth = self.root.winfo_screenwidth()
@@ -806,7 +901,10 @@ class App():
         self.build_gui()
         self.centerApp() # center application on screen
         self.root.lift() # bring app to front
+        self.root.after_idle(lambda: self.recordStartup('window'))
         self.root.mainloop()
+        self.metadata.shutdown()
+        self.connectionPools.close()
 
 # Start the app
 app = App()
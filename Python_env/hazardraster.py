@@ -0,0 +1,137 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def hazardValueField(df, valueFields):
+    """ returns the first of the value fields that is a numeric column of the frame, or None """
+    for field in valueFields:
+        if field in df.columns and df[field].dtype.kind in 'biuf':
+            return field
+    return None
+
+
+def overviewFactors(width, height, blockSize):
+    """ returns the overview decimation factors (2, 4, 8, ...) until the raster fits in a single block """
+    factors = []
+    factor = 2
+    while max(width, height) / float(factor // 2) > blockSize:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def writeHazardRaster(df, path, valueFields=None, resolution=0.001, blockSize=512, compression='deflate', resampling='average',
+                      nodata=-9999.0, workers=4, progress=None):
+    """ Rasterizes the hazard polygons to a Cloud-Optimized GeoTIFF
+
+        The grid is cut into windows of one block each, which are rasterized on a pool of threads and written
+        into a tiled working GeoTIFF in order. Overviews are built on the working file, which is then
+        copied with its overviews to the output as a tiled, compressed GeoTIFF in cloud-optimized layout (the
+        overviews and tiles after the header, in the order a reader requests them). Where hazard polygons
+        overlap the cell takes the highest value.
+
+        Keyword Arguments: \n
+            df: StudyRegionDataFrame -- the hazard frame with a WKT or shapely geometry column in WGS84
+            path: str -- the output path (example: 'C:/directory/hazard.tif')
+            valueFields: list -- the columns the cell values are read from, the first one present is used (example: ['PARAMVALUE', 'Depth'])
+            resolution: float -- the cell size in degrees (example: 0.001 is about 100 m)
+            blockSize: int -- the tile width and height in cells, a power of two
+            compression: str -- the GeoTIFF compression (choices: 'deflate', 'lzw', 'zstd', 'none')
+            resampling: str -- the overview resampling (choices: 'average', 'nearest', 'mode')
+            nodata: float -- the value of cells outside every hazard polygon
+            workers: int -- the number of threads rasterizing windows
+            progress: function -- optional progress(windows, totalWindows) called as windows are written
+    """
+    import numpy as np
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+    from rasterio.features import rasterize
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+    from rasterio.windows import transform as windowTransform
+    from shapely.wkt import loads
+
+    valueFields = valueFields or ['PARAMVALUE', 'Depth', 'value']
+    valueField = hazardValueField(df, valueFields)
+    if valueField is None:
+        raise ValueError('The hazard has none of the value fields ' + ', '.join(valueFields))
+
+    geometries = []
+    values = []
+    for geometry, value in zip(df['geometry'], df[valueField]):
+        if geometry is None or str(geometry) in ['', 'nan', 'None'] or value is None or math.isnan(value):
+            continue
+        geometry = geometry if hasattr(geometry, 'wkb') else loads(str(geometry))
+        if not geometry.is_empty:
+            geometries.append(geometry)
+            values.append(float(value))
+    if len(geometries) == 0:
+        raise ValueError('The hazard has no geometry to rasterize')
+    # rasterized in ascending order, so the highest of overlapping values is burned last
+    order = np.argsort(values, kind='stable')
+    geometries = [geometries[i] for i in order]
+    values = [values[i] for i in order]
+    bounds = np.array([geometry.bounds for geometry in geometries])
+
+    west, south = bounds[:, 0].min(), bounds[:, 1].min()
+    east, north = bounds[:, 2].max(), bounds[:, 3].max()
+    width = max(1, int(math.ceil((east - west) / resolution)))
+    height = max(1, int(math.ceil((north - south) / resolution)))
+    transform = from_origin(west, north, resolution, resolution)
+    profile = {
+        'driver': 'GTiff',
+        'width': width,
+        'height': height,
+        'count': 1,
+        'dtype': 'float32',
+        'crs': 'EPSG:4326',
+        'transform': transform,
+        'nodata': nodata,
+        'tiled': True,
+        'blockxsize': blockSize,
+        'blockysize': blockSize,
+        'compress': compression,
+        'BIGTIFF': 'IF_SAFER'
+    }
+    windows = [Window(column, row, min(blockSize, width - column), min(blockSize, height - row))
+               for row in range(0, height, blockSize) for column in range(0, width, blockSize)]
+
+    def rasterizeWindow(window):
+        left = west + window.col_off * resolution
+        top = north - window.row_off * resolution
+        right = left + window.width * resolution
+        bottom = top - window.height * resolution
+        selected = np.nonzero((bounds[:, 0] <= right) & (bounds[:, 2] >= left) & (bounds[:, 1] <= top) & (bounds[:, 3] >= bottom))[0]
+        if len(selected) == 0:
+            return window, None
+        cells = rasterize([(geometries[i], values[i]) for i in selected], out_shape=(window.height, window.width),
+                          transform=windowTransform(window, transform), fill=nodata, dtype='float32')
+        return window, cells
+
+    workingPath = path + '.tmp.tif'
+    try:
+        with rasterio.open(workingPath, 'w', **profile) as dst:
+            with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='HazardRaster') as executor:
+                # the windows are written on this thread as they finish, a dataset is not safe to share between threads
+                for done, (window, cells) in enumerate(executor.map(rasterizeWindow, windows), 1):
+                    # windows without hazard stay empty blocks, which read as nodata
+                    if cells is not None:
+                        dst.write(cells, 1, window=window)
+                    if progress is not None:
+                        progress(done, len(windows))
+            factors = overviewFactors(width, height, blockSize)
+            if len(factors) > 0:
+                dst.build_overviews(factors, getattr(Resampling, resampling))
+                dst.update_tags(ns='rio_overview', resampling=resampling)
+        options = {key: value for key, value in profile.items() if key in ['tiled', 'blockxsize', 'blockysize', 'compress', 'BIGTIFF']}
+        if compression != 'none':
+            # the floating point predictor shrinks smooth hazard surfaces
+            options['predictor'] = 3
+        rasterio.shutil.copy(workingPath, path + '.tmp', driver='GTiff', copy_src_overviews=True, **options)
+        os.replace(path + '.tmp', path)
+    finally:
+        for temporaryPath in [workingPath, path + '.tmp']:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
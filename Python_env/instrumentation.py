@@ -0,0 +1,203 @@
+import json
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from time import time
+from uuid import uuid4 as uuid
+
+# tracemalloc is process wide, so it runs while any job that asked for it is running
+_tracingLock = threading.Lock()
+_tracingJobs = 0
+# the spans open in any job, keyed by id - tracemalloc has one peak, which is added to every open span before it is reset
+_memorySpans = {}
+
+
+def _foldPeak():
+    """ adds the peak since the last reset to every open span and resets it - called with _tracingLock held
+
+        Returns:
+            current: int -- the traced memory in use
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    for record in _memorySpans.values():
+        record['memoryPeak'] = max(record['memoryPeak'], peak)
+    tracemalloc.reset_peak()
+    return current
+
+
+class Instrumentation():
+    """ Records a span for every stage of an export job and writes them as JSON lines
+
+        A span holds the stage, the start time, the seconds spent, the thread, the status, and whatever the
+        stage annotates - rows read or written and bytes written. With traceMemory the traced memory in use
+        at the end of the span and its peak while the span was open are added (tracemalloc slows Python code
+        down, so it is off by default). With a profile directory every span is profiled with cProfile on its
+        own thread and the merged profile of the job is dumped when it finishes.
+
+        Keyword Arguments: \n
+            logPath: str -- the JSON lines file the spans are appended to; spans are only kept in memory if None
+            profileDirectory: str -- optional directory of the cProfile dumps, one .prof file per job
+            traceMemory: bool -- record the memory in use with tracemalloc
+            attributes: dict -- added to the job span (example: the study region and analysis)
+    """
+
+    def __init__(self, logPath=None, profileDirectory=None, traceMemory=False, attributes=None):
+        self.logPath = logPath
+        self.profileDirectory = profileDirectory
+        self.traceMemory = traceMemory
+        self.attributes = attributes or {}
+        self.jobId = uuid().hex[0:12]
+        self.spans = []
+        self._profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started = None
+        self._jobMemory = {}
+
+    def start(self):
+        """ starts the job span, and memory tracing if requested """
+        global _tracingJobs
+        self._started = time()
+        if self.traceMemory:
+            with _tracingLock:
+                if _tracingJobs == 0:
+                    tracemalloc.start()
+                _tracingJobs += 1
+        self.beginMemory(self._jobMemory)
+
+    def finish(self, status, **attributes):
+        """ writes the job span, dumps the merged profile, and stops memory tracing
+
+            Keyword Arguments: \n
+                status: str -- the job outcome (example: 'complete', 'cancelled', 'failed')
+                attributes: added to the job span
+        """
+        global _tracingJobs
+        record = {'stage': 'job', 'span': 'export', 'status': status, 'seconds': time() - (self._started or time())}
+        record.update(self.attributes)
+        record.update(attributes)
+        self.endMemory(self._jobMemory)
+        record.update(self._jobMemory)
+        if self.traceMemory:
+            with _tracingLock:
+                _tracingJobs -= 1
+                if _tracingJobs == 0:
+                    tracemalloc.stop()
+        profilePath = self.dumpProfile()
+        if profilePath is not None:
+            record['profile'] = profilePath
+        self.write(record)
+
+    @contextmanager
+    def span(self, name, stage, **attributes):
+        """ Times the block as a span - annotate() adds attributes to the innermost open span of the thread
+
+            Keyword Arguments: \n
+                name: str -- the span name (example: 'Writing results to CSV')
+                stage: str -- the stage (choices: 'email', 'fetch', 'query', 'write', 'report')
+                attributes: added to the span
+        """
+        record = {'stage': stage, 'span': name, 'thread': threading.current_thread().name, 'start': time(), 'status': 'ok'}
+        record.update(attributes)
+        stack = self._stack()
+        stack.append(record)
+        memory = {}
+        self.beginMemory(memory)
+        profile = self.startProfile() if len(stack) == 1 else None
+        try:
+            yield record
+        except:
+            record['status'] = 'error'
+            record['error'] = str(sys.exc_info()[0])
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+            stack.pop()
+            record['seconds'] = time() - record['start']
+            self.endMemory(memory)
+            record.update(memory)
+            self.write(record)
+
+    def annotate(self, **attributes):
+        """ adds attributes (example: rows=1000) to the innermost open span of the calling thread """
+        stack = self._stack()
+        if len(stack) > 0:
+            stack[-1].update(attributes)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def beginMemory(self, memory):
+        """ starts tracking the peak memory of a span in the memory dict """
+        if not self.traceMemory:
+            return
+        with _tracingLock:
+            if tracemalloc.is_tracing():
+                memory['memoryPeak'] = _foldPeak()
+                _memorySpans[id(memory)] = memory
+
+    def endMemory(self, memory):
+        """ stops tracking a span - the memory dict holds the memory in use at the end and the peak while it was open """
+        with _tracingLock:
+            if id(memory) not in _memorySpans:
+                return
+            if tracemalloc.is_tracing():
+                memory['memory'] = _foldPeak()
+            del _memorySpans[id(memory)]
+
+    def startProfile(self):
+        if self.profileDirectory is None:
+            return None
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active on this thread
+            return None
+        return profile
+
+    def dumpProfile(self):
+        """ merges the span profiles and writes them to <profileDirectory>/<jobId>.prof
+
+            Returns:
+                path: str -- the profile path, or None if nothing was profiled
+        """
+        with self._lock:
+            profiles = self._profiles
+            self._profiles = []
+        if self.profileDirectory is None or len(profiles) == 0:
+            return None
+        try:
+            import pstats
+            os.makedirs(self.profileDirectory, exist_ok=True)
+            path = os.path.join(self.profileDirectory, self.jobId + '.prof')
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path)
+            return path
+        except:
+            print('Unable to write the export profile: ' + str(sys.exc_info()[0]))
+            return None
+
+    def write(self, record):
+        record['job'] = self.jobId
+        with self._lock:
+            self.spans.append(record)
+            if self.logPath is None:
+                return
+            try:
+                if os.path.dirname(self.logPath) != '':
+                    os.makedirs(os.path.dirname(self.logPath), exist_ok=True)
+                with open(self.logPath, 'a') as logFile:
+                    logFile.write(json.dumps(record, default=str) + '\n')
+            except:
+                print('Unable to write the export span log: ' + str(sys.exc_info()[0]))
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import threading
+from time import time
+
+
+class ExportManifest():
+    """ Records what every exported file was built from so unchanged files are not written again
+
+        The manifest is stored as export_manifest.json in the output directory. Each artifact entry holds
+        a hash of its source data and parameters plus the size and modified time of the files it wrote;
+        an artifact is current when the hash matches and its files are untouched.
+
+        Keyword Arguments: \n
+            outputPath: str -- the export output directory
+    """
+
+    fileName = 'export_manifest.json'
+
+    def __init__(self, outputPath):
+        self.outputPath = outputPath
+        self.path = os.path.join(outputPath, self.fileName)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as manifestFile:
+                self.artifacts = json.load(manifestFile)['artifacts']
+        except:
+            self.artifacts = {}
+
+    def artifactKey(self, source, parameters):
+        """ Hashes the inputs of an artifact
+
+            Keyword Arguments: \n
+                source: dict -- identifies the source data (example: the analysis and the database fingerprint)
+                parameters: dict -- the format options the artifact was written with
+            Returns:
+                key: str -- a sha1 hex digest
+        """
+        inputs = json.dumps({'source': source, 'parameters': parameters}, sort_keys=True, default=str)
+        return hashlib.sha1(inputs.encode('utf-8')).hexdigest()
+
+    def fileStamp(self, path):
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'modified': stat.st_mtime}
+
+    def isCurrent(self, name, key):
+        """ returns True if the artifact was written from the same inputs and its files have not changed since """
+        with self._lock:
+            entry = self.artifacts.get(name)
+        if entry is None or entry['key'] != key:
+            return False
+        try:
+            return all(self.fileStamp(os.path.join(self.outputPath, fileName)) == stamp for fileName, stamp in entry['files'].items())
+        except OSError:
+            return False
+
+    def record(self, name, key, paths):
+        """ stores the inputs and file stamps of an artifact that was just written - file names are relative to the output directory """
+        try:
+            files = {os.path.basename(path): self.fileStamp(path) for path in paths}
+        except OSError:
+            return
+        with self._lock:
+            self.artifacts[name] = {'key': key, 'files': files, 'written': time()}
+
+    def save(self):
+        """ writes the manifest - to a temp file first so an interrupted save keeps the previous manifest """
+        with self._lock:
+            manifest = {'artifacts': self.artifacts}
+        with open(self.path + '.tmp', 'w') as manifestFile:
+            json.dump(manifest, manifestFile, indent=2)
+        os.replace(self.path + '.tmp', self.path)
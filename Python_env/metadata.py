@@ -0,0 +1,199 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+# short hazard names shown in the study region dropdown
+hazardAbbreviations = {
+    'earthquake': 'EQ',
+    'flood': 'FL',
+    'hurricane': 'HU',
+    'tsunami': 'TS'
+}
+
+
+def studyRegionLabel(name, summary):
+    """ Formats a study region for the dropdown with its hazards and size (example: 'Irma_2017 (HU, 1,234 tracts)')
+
+        Keyword Arguments: \n
+            name: str -- the study region name
+            summary: dict -- the hazards and tracts of the study region, see StudyRegionMetadata.summary(); None shows the name only
+    """
+    if summary is None:
+        return str(name)
+    details = []
+    if len(summary['hazards']) > 0:
+        details.append('/'.join(hazardAbbreviations.get(str(x).lower(), str(x)) for x in summary['hazards']))
+    if summary.get('tracts') is not None:
+        details.append('{t:,} tracts'.format(t=int(summary['tracts'])))
+    if len(details) == 0:
+        return str(name)
+    return '{n} ({d})'.format(n=name, d=', '.join(details))
+
+
+class StudyRegionMetadata():
+    """ Loads the hazards, scenarios, and return periods of each study region off the UI thread and caches them
+
+        The loads requested by the UI run on a single background worker. prefetch() loads every study region
+        on a separate pool of workers at startup, so a later selection is served from the cache; a region is
+        loaded by one thread at a time and a selection waits for a prefetch already loading it. Results are
+        cached per study region until the ttl expires or the region is invalidated. Each method returns a
+        concurrent.futures.Future. The StudyRegion handed to the caller keeps its defaults; the scenarios and
+        return periods of other hazards are looked up on a second StudyRegion owned by the cache.
+
+        Keyword Arguments: \n
+            createStudyRegion: function -- creates a StudyRegion from a study region name (hazpy.legacy.StudyRegion)
+            createHazusDB: function -- creates a HazusDB (hazpy.legacy.HazusDB)
+            ttl: int -- seconds a cached study region stays valid
+    """
+
+    def __init__(self, createStudyRegion, createHazusDB=None, ttl=600):
+        self.createStudyRegion = createStudyRegion
+        self.createHazusDB = createHazusDB
+        self.ttl = ttl
+        self._regions = {}
+        self._regionLocks = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Metadata')
+        self._prefetchExecutor = None
+
+    def invalidate(self, name=None):
+        """ drops the cached metadata of a study region, or of every region if no name is given """
+        with self._lock:
+            if name is None:
+                self._regions = {}
+            else:
+                self._regions.pop(name, None)
+
+    def cached(self, name):
+        """ returns the cached metadata of a study region if it is still valid, otherwise None """
+        with self._lock:
+            region = self._regions.get(name)
+        if region is not None and time() - region['loaded'] < self.ttl:
+            return region
+        return None
+
+    def getStudyRegions(self):
+        """ returns a Future that resolves to the study regions in the local Hazus database """
+        return self._executor.submit(lambda: self.createHazusDB().getStudyRegions())
+
+    def getMetadata(self, name):
+        """ Loads a study region with its hazards, default scenarios, and default return periods
+
+            Returns:
+                future: Future -- resolves to a dict with the studyRegion, hazards, scenarios, and returnPeriods
+        """
+        return self._executor.submit(self._loadRegion, name)
+
+    def getScenarios(self, name, hazard):
+        """ returns a Future that resolves to the scenarios of a hazard """
+        return self._executor.submit(self._loadScenarios, name, hazard)
+
+    def getReturnPeriods(self, name, hazard, scenario):
+        """ returns a Future that resolves to the return periods of a hazard scenario """
+        return self._executor.submit(self._loadReturnPeriods, name, hazard, scenario)
+
+    def prefetch(self, names, workers=2):
+        """ Loads the metadata and size of every study region concurrently in the background
+
+            Keyword Arguments: \n
+                names: list -- the study region names
+                workers: int -- the number of study regions loaded at the same time; keep it below the connection pool size so selections are not queued behind the prefetch
+            Returns:
+                futures: list -- one Future per study region, resolving to (name, summary)
+        """
+        if self._prefetchExecutor is None:
+            self._prefetchExecutor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='MetadataPrefetch')
+        return [self._prefetchExecutor.submit(self._prefetchRegion, name) for name in names]
+
+    def summary(self, name):
+        """ returns the cached hazards, tracts, and result rows of a study region, or None if it is not loaded """
+        region = self.cached(name)
+        if region is None:
+            return None
+        return {'hazards': region['hazards'], 'tracts': region.get('tracts'), 'rows': region.get('rows')}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        if self._prefetchExecutor is not None:
+            # a prefetch still queued when the app closes is dropped instead of delaying the exit
+            self._prefetchExecutor.shutdown(wait=False, cancel_futures=True)
+
+    def _regionLock(self, name):
+        with self._lock:
+            return self._regionLocks.setdefault(name, threading.RLock())
+
+    def _region(self, name):
+        """ returns the cached metadata of a study region, loading the region and its defaults on a miss """
+        with self._regionLock(name):
+            region = self.cached(name)
+            if region is None:
+                studyRegion = self.createStudyRegion(str(name))
+                defaultHazard = getattr(studyRegion, 'hazard', None)
+                defaultScenario = getattr(studyRegion, 'scenario', None)
+                region = {
+                    'studyRegion': studyRegion,
+                    'loaded': time(),
+                    'hazards': studyRegion.getHazardsAnalyzed(),
+                    'defaultHazard': defaultHazard,
+                    'defaultScenario': defaultScenario,
+                    # keyed by hazard and by (hazard, scenario), with the study region defaults in place of None
+                    'scenariosByHazard': {defaultHazard: studyRegion.getScenarios()},
+                    'returnPeriodsByScenario': {(defaultHazard, defaultScenario): studyRegion.getReturnPeriods()}
+                }
+                with self._lock:
+                    self._regions[name] = region
+            return region
+
+    def _loadRegion(self, name):
+        region = self._region(name)
+        return {
+            'studyRegion': region['studyRegion'],
+            'hazards': region['hazards'],
+            'scenarios': region['scenariosByHazard'][region['defaultHazard']],
+            'returnPeriods': region['returnPeriodsByScenario'][(region['defaultHazard'], region['defaultScenario'])]
+        }
+
+    def _lookupRegion(self, name, region):
+        """ returns the StudyRegion the hazard and scenario lookups switch between, created on first use - call with the region lock held """
+        if 'lookupRegion' not in region:
+            region['lookupRegion'] = self.createStudyRegion(str(name))
+        return region['lookupRegion']
+
+    def _loadScenarios(self, name, hazard):
+        with self._regionLock(name):
+            region = self._region(name)
+            if hazard is None:
+                hazard = region['defaultHazard']
+            if hazard not in region['scenariosByHazard']:
+                lookupRegion = self._lookupRegion(name, region)
+                lookupRegion.setHazard(hazard)
+                region['scenariosByHazard'][hazard] = lookupRegion.getScenarios()
+            return region['scenariosByHazard'][hazard]
+
+    def _loadReturnPeriods(self, name, hazard, scenario):
+        with self._regionLock(name):
+            region = self._region(name)
+            if hazard is None:
+                hazard = region['defaultHazard']
+            if scenario is None and hazard == region['defaultHazard']:
+                scenario = region['defaultScenario']
+            if (hazard, scenario) not in region['returnPeriodsByScenario']:
+                lookupRegion = self._lookupRegion(name, region)
+                lookupRegion.setHazard(hazard)
+                if scenario is not None:
+                    lookupRegion.setScenario(scenario)
+                region['returnPeriodsByScenario'][(hazard, scenario)] = lookupRegion.getReturnPeriods()
+            return region['returnPeriodsByScenario'][(hazard, scenario)]
+
+    def _prefetchRegion(self, name):
+        with self._regionLock(name):
+            region = self._region(name)
+            if 'tracts' not in region:
+                # the size of the region and of its stored results in a single round trip
+                sql = """SELECT (SELECT COUNT(*) FROM [{s}].[dbo].[hzTract]) AS tracts,
+                    (SELECT SUM(p.rows) FROM [{s}].sys.partitions p INNER JOIN [{s}].sys.tables t ON p.object_id = t.object_id
+                        WHERE p.index_id IN (0, 1)) AS rows""".format(s=name)
+                counts = region['studyRegion'].query(sql)
+                region['tracts'] = counts['tracts'][0]
+                region['rows'] = counts['rows'][0]
+        return name, self.summary(name)
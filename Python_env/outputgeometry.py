@@ -0,0 +1,34 @@
+def outputGeometry(df, precision=None, tolerance=None):
+    """ Returns a copy of a StudyRegionDataFrame with its geometry simplified and its coordinates rounded for output
+
+        Simplification uses shapely's topology-preserving Douglas-Peucker, so no polygon becomes invalid or
+        collapses; each geometry is simplified on its own, so the shared border of two neighbouring polygons
+        can differ by up to the tolerance. The geometry is returned as trimmed WKT, which the hazpy writers
+        read back like the database geometry. The input frame is not changed.
+
+        Keyword Arguments: \n
+            df: StudyRegionDataFrame -- a frame with a WKT or shapely geometry column, or a block, tract, or county column
+            precision: int -- the decimal places kept in every coordinate (example: 6 is about 0.1 m); full precision if None
+            tolerance: float -- the simplification tolerance in degrees (example: 0.0001 is about 10 m); not simplified if None
+        Returns:
+            df: StudyRegionDataFrame -- the frame with the output geometry, or the input frame if precision and tolerance are None
+    """
+    if precision is None and tolerance is None:
+        return df
+    from hazpy.legacy import StudyRegionDataFrame
+    from shapely.wkt import dumps, loads
+
+    if 'geometry' not in df.columns:
+        df = df.addGeometry()
+    geometries = []
+    for x in df['geometry']:
+        if x is None or str(x) in ['', 'nan', 'None']:
+            geometries.append(x)
+            continue
+        geometry = x if hasattr(x, 'wkb') else loads(str(x))
+        if tolerance is not None and tolerance > 0:
+            geometry = geometry.simplify(tolerance, preserve_topology=True)
+        geometries.append(dumps(geometry, trim=True, rounding_precision=precision if precision is not None else -1))
+    output = StudyRegionDataFrame(df, df.copy())
+    output['geometry'] = geometries
+    return output
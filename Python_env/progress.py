@@ -0,0 +1,199 @@
+import json
+import os
+import sys
+import threading
+from time import time
+
+# seconds a unit of each stage is expected to take before it has any history
+defaultSeconds = {
+    'email': 5,
+    'fetch': 10,
+    'write': 3,
+    'report': 60
+}
+
+# every job updating the same history file reads and writes it one at a time
+_historyLock = threading.Lock()
+
+
+def formatEta(seconds):
+    """ formats the seconds left as text for the progress label (example: 150 -> 'about 3 min left') """
+    if seconds is None:
+        return ''
+    if seconds < 60:
+        return 'less than a minute left'
+    minutes = int(round(seconds / 60.0))
+    if minutes < 60:
+        return 'about {m} min left'.format(m=minutes)
+    return 'about {h} h {m} min left'.format(h=minutes // 60, m=minutes % 60)
+
+
+class ProgressModel():
+    """ Tracks the progress of an export job as work units weighted by how long they took before
+
+        Every step and writer of the job is a unit, keyed by its message. A unit is weighted by its expected
+        seconds: the seconds per row it took in earlier exports times the rows it handles now, or its average
+        seconds if the rows are not known yet, or a stage default the first time. Units report the work they
+        have done (rows written, images rendered) as they run; a unit that cannot report is assumed to progress
+        with time until it is near its expected seconds. The measured seconds, rows, and work of every
+        finished unit are averaged into the history file.
+
+        Keyword Arguments: \n
+            historyPath: str -- the JSON file of the unit history; kept in memory only if None
+            smoothing: float -- the weight of the latest export in the history averages
+    """
+
+    def __init__(self, historyPath=None, smoothing=0.3):
+        self.historyPath = historyPath
+        self.smoothing = smoothing
+        self.history = self.readHistory()
+        self.units = {}
+        self.started = None
+        self._value = 0.0
+        self._order = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def readHistory(self):
+        if self.historyPath is None or not os.path.exists(self.historyPath):
+            return {}
+        try:
+            with open(self.historyPath) as historyFile:
+                return json.load(historyFile)
+        except:
+            print('Unable to read the export progress history: ' + str(sys.exc_info()[0]))
+            return {}
+
+    def addUnit(self, name, stage, rows=None):
+        """ Adds a unit of work
+
+            Keyword Arguments: \n
+                name: str -- the unit name, the step or writer message (example: 'Writing results to CSV')
+                stage: str -- the unit stage (choices: 'email', 'fetch', 'write', 'report')
+                rows: function -- optional function returning the rows the unit handles, or None while unknown
+        """
+        with self._lock:
+            self.units[name] = {'stage': stage, 'rows': rows, 'start': None, 'end': None, 'done': 0, 'total': None}
+            self._order.append(name)
+
+    def start(self):
+        self.started = time()
+
+    def begin(self, name):
+        """ marks the unit as running on the calling thread - advance() reports the work of this unit """
+        self._local.unit = name
+        with self._lock:
+            if name in self.units:
+                self.units[name]['start'] = time()
+
+    def advance(self, done, total=None):
+        """ Reports the work done by the unit running on the calling thread
+
+            Keyword Arguments: \n
+                done: int -- the work done so far (example: rows written)
+                total: int -- the total work of the unit; the work of earlier exports is used if None
+        """
+        name = getattr(self._local, 'unit', None)
+        with self._lock:
+            if name in self.units:
+                self.units[name]['done'] = done
+                if total is not None:
+                    self.units[name]['total'] = total
+
+    def finish(self, name):
+        """ marks the unit as finished """
+        with self._lock:
+            if name in self.units:
+                self.units[name]['end'] = time()
+        if getattr(self._local, 'unit', None) == name:
+            self._local.unit = None
+
+    def unitRows(self, unit):
+        try:
+            return unit['rows']() if unit['rows'] is not None else None
+        except:
+            return None
+
+    def expectedSeconds(self, name, unit):
+        """ returns the seconds the unit is expected to take from the history """
+        history = self.history.get(name, {})
+        rows = self.unitRows(unit)
+        if rows is not None and history.get('secondsPerRow') is not None:
+            return max(history['secondsPerRow'] * rows, 0.01)
+        if history.get('seconds') is not None:
+            return max(history['seconds'], 0.01)
+        return defaultSeconds.get(unit['stage'], 5)
+
+    def unitFraction(self, name, unit, now):
+        """ returns the fraction of the unit done - from its work reports, or from the time it has run """
+        if unit['end'] is not None:
+            return 1.0
+        if unit['start'] is None:
+            return 0.0
+        total = unit['total'] if unit['total'] is not None else self.history.get(name, {}).get('work')
+        if total is not None and total > 0 and unit['done'] > 0:
+            return min(unit['done'] / float(total), 0.99)
+        return min((now - unit['start']) / self.expectedSeconds(name, unit), 0.95)
+
+    def estimate(self):
+        """ Estimates the progress of the job
+
+            Returns:
+                value: float -- the percent done, weighted by the expected seconds of each unit
+                eta: float -- the seconds left, or None before the job starts
+        """
+        now = time()
+        with self._lock:
+            units = [(name, dict(self.units[name])) for name in self._order]
+        if len(units) == 0 or self.started is None:
+            return 0.0, None
+        weights = [self.expectedSeconds(name, unit) for name, unit in units]
+        fractions = [self.unitFraction(name, unit, now) for name, unit in units]
+        total = sum(weights)
+        done = sum(weight * fraction for weight, fraction in zip(weights, fractions))
+        elapsed = now - self.started
+        if done / total >= 0.05 and elapsed > 1:
+            # the measured pace covers concurrent writers and a machine faster or slower than before
+            eta = elapsed * (total - done) / done
+        else:
+            eta = total - done
+        # a unit switching from its time estimate to its work reports can lower the estimate, the bar never moves back
+        with self._lock:
+            self._value = max(self._value, done / total * 100)
+            value = self._value
+        return value, eta
+
+    def saveHistory(self):
+        """ averages the seconds, seconds per row, and work of the finished units into the history file """
+        with self._lock:
+            finished = [(name, dict(unit)) for name, unit in self.units.items() if unit['start'] is not None and unit['end'] is not None]
+        measurements = {}
+        for name, unit in finished:
+            seconds = unit['end'] - unit['start']
+            rows = self.unitRows(unit)
+            measurements[name] = {
+                'seconds': seconds,
+                'secondsPerRow': seconds / rows if rows is not None and rows > 0 else None,
+                'work': unit['done'] if unit['done'] > 0 else None
+            }
+        with _historyLock:
+            # other jobs may have updated the file since this job read it
+            history = self.readHistory() if self.historyPath is not None else self.history
+            for name, measured in measurements.items():
+                entry = history.setdefault(name, {})
+                for field, value in measured.items():
+                    if value is None:
+                        continue
+                    previous = entry.get(field)
+                    entry[field] = value if previous is None else previous + self.smoothing * (value - previous)
+            self.history = history
+            if self.historyPath is None:
+                return
+            try:
+                if os.path.dirname(self.historyPath) != '':
+                    os.makedirs(os.path.dirname(self.historyPath), exist_ok=True)
+                with open(self.historyPath + '.tmp', 'w') as historyFile:
+                    json.dump(history, historyFile, indent=2)
+                os.replace(self.historyPath + '.tmp', self.historyPath)
+            except:
+                print('Unable to save the export progress history: ' + str(sys.exc_info()[0]))
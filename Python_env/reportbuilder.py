@@ -0,0 +1,181 @@
+import hashlib
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+# hazpy builds every report in the same temp directory under the working directory and draws
+# through the global pyplot state, so reports from concurrent jobs are built one at a time
+reportLock = threading.Lock()
+
+
+class ReportBuilder():
+    """ Builds the hazpy PDF report from the frames an export job already fetched
+
+        The report getters are pointed at the job's artifact cache, so the report does not query the
+        results, building damage, or essential facilities a second time. The county boundaries drawn on
+        every map are cached on disk per study region, and the remote icons in the report template are
+        downloaded once and reused across runs and study regions. A draft dpi renders the map and chart
+        images at a lower resolution.
+
+        Keyword Arguments: \n
+            cacheDirectory: str -- the directory the county layers and template icons are cached in; None keeps them in memory only
+            draftDpi: int -- the resolution of the report images; None keeps the hazpy default (600)
+            httpTimeout: int -- seconds to wait for a template icon download
+    """
+
+    # report getters served from the export job's artifact cache
+    reportGetters = [
+        'getResults',
+        'getBuildingDamageByOccupancy',
+        'getBuildingDamageByType',
+        'getEssentialFacilities'
+    ]
+
+    def __init__(self, cacheDirectory='cache/report', draftDpi=None, httpTimeout=5):
+        self.cacheDirectory = cacheDirectory
+        self.draftDpi = draftDpi
+        self.httpTimeout = httpTimeout
+        self._counties = {}
+        # assets that could not be downloaded are not retried until the app restarts
+        self._unavailableAssets = set()
+        self._lock = threading.Lock()
+
+    def prepare(self, report, cache):
+        """ Points the report at the job's frames and the cached county and icon layers
+
+            Keyword Arguments: \n
+                report: Report -- the hazpy report of the study region
+                cache: ArtifactCache -- the export job's artifact cache
+        """
+        for getterName in self.reportGetters:
+            attribute = '_Report__' + getterName
+            if hasattr(report, attribute):
+                setattr(report, attribute, self.copyGetter(cache, getterName))
+        if hasattr(report, 'getCounties'):
+            # keep the study region query, so preparing the report again does not wrap it twice
+            if not hasattr(report, '_queryCounties'):
+                report._queryCounties = report.getCounties
+            name = str(cache.studyRegion.name)
+            report.getCounties = lambda: self.getCounties(name, report._queryCounties)
+        self.localizeAssets(report)
+
+    def copyGetter(self, cache, getterName):
+        """ returns a getter that hands the report its own copy - the report adds columns to the frames it draws """
+        def getCopy():
+            from hazpy.legacy import StudyRegionDataFrame
+            frame = getattr(cache, getterName)()
+            return StudyRegionDataFrame(frame, frame.copy())
+        return getCopy
+
+    def getCounties(self, name, getCounties):
+        """ returns the county boundaries of a study region, queried once and cached on disk """
+        with self._lock:
+            if name not in self._counties:
+                self._counties[name] = self.loadCounties(name, getCounties)
+            counties = self._counties[name]
+        return counties.copy()
+
+    def loadCounties(self, name, getCounties):
+        import geopandas as gpd
+        import pandas as pd
+        from shapely.wkt import loads
+        path = None
+        if self.cacheDirectory is not None:
+            path = os.path.join(self.cacheDirectory, 'counties', name + '.parquet')
+            if os.path.exists(path):
+                try:
+                    df = pd.read_parquet(path)
+                    return gpd.GeoDataFrame(df.drop(columns=['geometry']), geometry=[loads(x) for x in df['geometry']])
+                except:
+                    print('Unable to read the cached counties of ' + name + ': ' + str(sys.exc_info()[0]))
+        counties = getCounties()
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                df = pd.DataFrame(counties)
+                df['geometry'] = [x.wkt for x in counties['geometry']]
+                df.to_parquet(path + '.tmp')
+                os.replace(path + '.tmp', path)
+            except:
+                print('Unable to cache the counties of ' + name + ': ' + str(sys.exc_info()[0]))
+        return counties
+
+    def localizeAssets(self, report):
+        """ replaces the remote template icons with local copies, downloading each icon once """
+        if self.cacheDirectory is None:
+            return
+        assets = getattr(report, 'assets', None)
+        if isinstance(assets, dict):
+            for key, url in assets.items():
+                local = self.localAsset(url)
+                if isinstance(getattr(report, 'icon', None), str) and report.icon == url:
+                    report.icon = local
+                assets[key] = local
+        elif isinstance(getattr(report, 'icon', None), str):
+            report.icon = self.localAsset(report.icon)
+
+    def localAsset(self, url):
+        """ returns the path of a cached copy of a remote asset, or the url if it cannot be downloaded """
+        if not isinstance(url, str) or not url.startswith('http') or url in self._unavailableAssets:
+            return url
+        extension = os.path.splitext(url)[1]
+        path = os.path.join(self.cacheDirectory, 'assets', hashlib.sha1(url.encode('utf-8')).hexdigest()[0:16] + extension)
+        with self._lock:
+            if not os.path.exists(path):
+                try:
+                    import requests
+                    response = requests.get(url, timeout=self.httpTimeout)
+                    response.raise_for_status()
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path + '.tmp', 'wb') as assetFile:
+                        assetFile.write(response.content)
+                    os.replace(path + '.tmp', path)
+                except:
+                    print('Unable to cache the report asset ' + url + ': ' + str(sys.exc_info()[0]))
+                    self._unavailableAssets.add(url)
+                    return url
+        return os.path.abspath(path)
+
+    @contextmanager
+    def imageResolution(self, progress=None):
+        """ Renders every matplotlib image saved inside the block at the draft dpi
+
+            Keyword Arguments: \n
+                progress: function -- optional progress(images) called with the number of images rendered so far
+        """
+        if self.draftDpi is None and progress is None:
+            yield
+            return
+        from matplotlib.figure import Figure
+        savefig = Figure.savefig
+        draftDpi = self.draftDpi
+        images = [0]
+
+        def saveDraft(figure, *args, **kwargs):
+            if draftDpi is not None:
+                kwargs['dpi'] = draftDpi
+            result = savefig(figure, *args, **kwargs)
+            if progress is not None:
+                images[0] += 1
+                progress(images[0])
+            return result
+        Figure.savefig = saveDraft
+        try:
+            yield
+        finally:
+            Figure.savefig = savefig
+
+    def build(self, report, cache, path, progress=None):
+        """ Builds the report PDF
+
+            Keyword Arguments: \n
+                report: Report -- the hazpy report of the study region, with the title and subtitle set
+                cache: ArtifactCache -- the export job's artifact cache
+                path: str -- the output path (example: 'C:/directory/report_summary.pdf')
+                progress: function -- optional progress(images) called with the map and chart images rendered
+        """
+        self.prepare(report, cache)
+        with reportLock:
+            with self.imageResolution(progress):
+                report.save(path, build=True)
@@ -0,0 +1,133 @@
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import threading
+
+# pandas and pyarrow are imported on first use to keep them off the app startup path
+pyarrowInstalled = importlib.util.find_spec('pyarrow') is not None
+
+
+def analysisKey(studyRegion):
+    """ returns the study region name, hazard, scenario, and return period identifying an analysis """
+    return {
+        'studyRegion': studyRegion.name,
+        'hazard': str(getattr(studyRegion, 'hazard', None)),
+        'scenario': str(getattr(studyRegion, 'scenario', None)),
+        'returnPeriod': str(getattr(studyRegion, 'returnPeriod', None))
+    }
+
+
+def fingerprint(studyRegion):
+    """ Queries a fingerprint of the study region database in a single round trip
+
+        Returns:
+            fingerprint: str -- a hash of the row count, schema change, and last data update of every table
+    """
+    sql = """SELECT t.name AS tableName, t.modify_date AS modifyDate, r.rowCount, u.lastUpdate
+        FROM [{s}].sys.tables t
+        INNER JOIN (SELECT object_id, SUM(rows) AS rowCount FROM [{s}].sys.partitions
+            WHERE index_id IN (0, 1) GROUP BY object_id) r
+        ON t.object_id = r.object_id
+        LEFT JOIN (SELECT object_id, MAX(last_user_update) AS lastUpdate FROM sys.dm_db_index_usage_stats
+            WHERE database_id = DB_ID('{s}') GROUP BY object_id) u
+        ON t.object_id = u.object_id
+        ORDER BY t.name""".format(s=studyRegion.name)
+    df = studyRegion.query(sql)
+    return hashlib.sha1(df.to_csv(index=False).encode('utf-8')).hexdigest()
+
+
+class ResultCache():
+    """ Stores study region query results on disk as Parquet so unchanged analyses are not queried again
+
+        Entries are grouped by analysis - study region, hazard, scenario, and return period - and stamped
+        with a fingerprint of the study region database (row counts and last update of every table). When
+        the fingerprint changes the entries of that analysis are dropped and fetched again.
+
+        Keyword Arguments: \n
+            directory: str -- the cache root directory
+            enabled: bool -- False turns every lookup into a miss and skips writes
+    """
+
+    def __init__(self, directory='cache/results', enabled=True):
+        self.directory = directory
+        self.enabled = enabled and pyarrowInstalled
+        self._lock = threading.Lock()
+
+    def analysisKey(self, studyRegion):
+        return analysisKey(studyRegion)
+
+    def fingerprint(self, studyRegion):
+        return fingerprint(studyRegion)
+
+    def entryDirectory(self, analysisKey):
+        keyHash = hashlib.sha1(json.dumps(analysisKey, sort_keys=True).encode('utf-8')).hexdigest()[0:16]
+        return os.path.join(self.directory, analysisKey['studyRegion'], keyHash)
+
+    def validate(self, analysisKey, fingerprint):
+        """ drops the cached entries of an analysis if they were stored under another fingerprint """
+        if not self.enabled:
+            return
+        entryDirectory = self.entryDirectory(analysisKey)
+        fingerprintPath = os.path.join(entryDirectory, 'fingerprint.json')
+        with self._lock:
+            try:
+                with open(fingerprintPath) as fingerprintFile:
+                    if json.load(fingerprintFile)['fingerprint'] == fingerprint:
+                        return
+            except:
+                pass
+            shutil.rmtree(entryDirectory, ignore_errors=True)
+            os.makedirs(entryDirectory, exist_ok=True)
+            with open(fingerprintPath, 'w') as fingerprintFile:
+                json.dump({'analysis': analysisKey, 'fingerprint': fingerprint}, fingerprintFile)
+
+    def load(self, analysisKey, name):
+        """ Reads a cached frame
+
+            Keyword Arguments: \n
+                analysisKey: dict -- the analysis the frame belongs to, see analysisKey()
+                name: str -- the frame name, typically the StudyRegion getter name
+            Returns:
+                df: pandas dataframe -- the cached frame, or None on a cache miss
+        """
+        if not self.enabled:
+            return None
+        path = os.path.join(self.entryDirectory(analysisKey), name + '.parquet')
+        if not os.path.exists(path):
+            return None
+        try:
+            import pandas as pd
+            return pd.read_parquet(path)
+        except:
+            print('Unable to read the cached ' + name + ': ' + str(sys.exc_info()[0]))
+            return None
+
+    def save(self, analysisKey, name, df):
+        """ Writes a frame to the cache - geometries are stored as WKT, which the hazpy writers accept """
+        if not self.enabled:
+            return
+        path = os.path.join(self.entryDirectory(analysisKey), name + '.parquet')
+        try:
+            import pandas as pd
+            df = pd.DataFrame(df)
+            for column in df.columns[df.dtypes == object]:
+                if df[column].map(lambda x: hasattr(x, 'wkt')).any():
+                    df[column] = df[column].map(lambda x: x.wkt if hasattr(x, 'wkt') else x)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temp file first so a reader never sees a partial file
+            df.to_parquet(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        except:
+            print('Unable to cache ' + name + ': ' + str(sys.exc_info()[0]))
+            try:
+                os.remove(path + '.tmp')
+            except OSError:
+                pass
+
+    def clear(self):
+        """ deletes every cached entry """
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,218 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# the census unit the hazpy results of each hazard are summarized by
+resultUnits = {
+    'earthquake': 'tract',
+    'flood': 'block',
+    'hurricane': 'tract',
+    'tsunami': 'block'
+}
+
+# the hazard layer value column of each hazard
+hazardFields = {
+    'earthquake': 'PARAMVALUE',
+    'flood': 'Depth',
+    'hurricane': 'PARAMVALUE',
+    'tsunami': 'Depth'
+}
+
+occupancies = ['AGR', 'COM', 'EDU', 'GOV', 'IND', 'REL', 'RES']
+buildingTypes = ['Concrete', 'ManufHousing', 'Masonry', 'Steel', 'Wood']
+facilityTypes = ['Care', 'EOC', 'Fire', 'Police', 'School']
+stateAbbreviations = ['FL', 'GA', 'SC', 'NC', 'AL', 'MS', 'LA', 'TX', 'VA', 'MD']
+
+
+def squares(x, y, size):
+    """ returns the WKT of axis aligned squares with lower left corners x, y """
+    x2 = x + size
+    y2 = y + size
+    return ['POLYGON (({a} {b}, {c} {b}, {c} {d}, {a} {d}, {a} {b}))'.format(a=a, b=b, c=c, d=d)
+            for a, b, c, d in zip(x, y, x2, y2)]
+
+
+class SyntheticStudyRegion():
+    """ Stands in for a hazpy StudyRegion with generated data of a chosen size, so the export paths can be
+        benchmarked without a Hazus database
+
+        Tracts are laid out on a grid of squares grouped into counties and states; essential facilities are
+        points and the hazard layer is a grid of overlapping squares. The getters return new frames on every
+        call like hazpy does, wrapped as hazpy StudyRegionDataFrames so the real format writers run. query()
+        answers the database fingerprint and the tract, block, and county geometry queries the writers make.
+
+        Keyword Arguments: \n
+            hazard: str -- the hazard analyzed (choices: 'earthquake', 'flood', 'hurricane', 'tsunami')
+            tracts: int -- the number of census tracts (or blocks for flood and tsunami)
+            facilities: int -- the number of essential facilities
+            hazardPolygons: int -- the number of hazard polygons
+            states: int -- the number of states the tracts are spread over
+            countiesPerState: int -- the number of counties in each state
+            seed: int -- the random seed; the same arguments and seed generate the same region
+    """
+
+    def __init__(self, hazard='hurricane', tracts=1000, facilities=200, hazardPolygons=500, states=2, countiesPerState=20, seed=0):
+        self.name = 'SYN_{h}_{t}'.format(h=hazard[0:2].upper(), t=tracts)
+        self.hazard = hazard
+        self.hazards = [hazard]
+        self.scenario = 'Synthetic'
+        self.returnPeriod = 'Use Current'
+        self.conn = None
+        self.unit = resultUnits[hazard]
+        rng = np.random.default_rng(seed)
+
+        # tracts on a grid, numbered within their county
+        side = int(np.ceil(np.sqrt(tracts)))
+        index = np.arange(tracts)
+        x = -90.0 + (index % side) * 0.01
+        y = 30.0 + (index // side) * 0.01
+        counties = states * countiesPerState
+        county = index * counties // max(tracts, 1)
+        stateCodes = np.array(['{s:02d}'.format(s=12 + s) for s in range(states)])
+        countyFips = np.char.add(stateCodes[county // countiesPerState], np.char.mod('%03d', county % countiesPerState * 2 + 1))
+        tractIds = np.char.add(countyFips, np.char.mod('%06d', index))
+        if self.unit == 'block':
+            tractIds = np.char.add(tractIds, np.char.mod('%04d', index % 10000))
+        self._units = pd.DataFrame({self.unit: tractIds, 'county': countyFips, 'geometry': squares(x, y, 0.01)})
+        self._counties = pd.DataFrame({
+            'county': np.unique(countyFips),
+            'state': [stateAbbreviations[i % len(stateAbbreviations)] for i in range(len(np.unique(countyFips)))]
+        })
+        self._counties['name'] = ['County ' + x for x in self._counties['county']]
+        extent = (x.min(), y.min(), x.max() + 0.01, y.max() + 0.01)
+
+        econLoss = rng.exponential(2e6, tracts)
+        buildings = rng.integers(50, 2000, tracts)
+        damage = rng.dirichlet([8, 4, 2, 1, 0.5], tracts) * buildings[:, None]
+        self._results = pd.DataFrame({
+            self.unit: tractIds,
+            'EconLoss': econLoss,
+            'Affected': damage[:, 1],
+            'Minor': damage[:, 2],
+            'Major': damage[:, 3],
+            'Destroyed': damage[:, 4],
+            'Fatalities': rng.poisson(0.2, tracts),
+            'Injuries': rng.poisson(1.5, tracts),
+            'DisplacedHouseholds': rng.exponential(5, tracts),
+            'ShelterNeeds': rng.exponential(2, tracts),
+            'DebrisBW': rng.exponential(1000, tracts),
+            'DebrisCS': rng.exponential(400, tracts),
+            'DebrisTree': rng.exponential(800, tracts),
+            'DebrisEligibleTree': rng.exponential(300, tracts),
+            'Population': rng.integers(500, 8000, tracts),
+            'Housing': buildings,
+            'geometry': self._units['geometry']
+        })
+        self._results['DebrisTotal'] = self._results[['DebrisBW', 'DebrisCS', 'DebrisTree']].sum(axis=1)
+        # hurricane residential damage counts used by the draft email
+        residential = rng.dirichlet([8, 4, 2, 1, 0.5], tracts) * (buildings * 0.8)[:, None]
+        self._residential = pd.DataFrame({self.unit: tractIds,'affected': residential[:, 1], 'minor': residential[:, 2],
+                                          'major': residential[:, 3], 'destroyed': residential[:, 4]})
+
+        fx = rng.uniform(extent[0], extent[2], facilities)
+        fy = rng.uniform(extent[1], extent[3], facilities)
+        self._facilities = pd.DataFrame({
+            'FacilityId': ['FAC{i:07d}'.format(i=i) for i in range(facilities)],
+            'FacilityType': rng.choice(facilityTypes, facilities),
+            'Name': ['Facility {i}'.format(i=i) for i in range(facilities)],
+            'Affected': rng.uniform(0, 1, facilities),
+            'Minor': rng.uniform(0, 1, facilities),
+            'Major': rng.uniform(0, 1, facilities),
+            'Destroyed': rng.uniform(0, 1, facilities),
+            'Functionality': rng.uniform(0, 100, facilities),
+            'geometry': ['POINT ({a} {b})'.format(a=a, b=b) for a, b in zip(fx, fy)]
+        })
+
+        hazardSide = int(np.ceil(np.sqrt(hazardPolygons)))
+        hazardIndex = np.arange(hazardPolygons)
+        hazardSize = max(extent[2] - extent[0], extent[3] - extent[1]) / hazardSide
+        hx = extent[0] + (hazardIndex % hazardSide) * hazardSize
+        hy = extent[1] + (hazardIndex // hazardSide) * hazardSize
+        self._hazard = pd.DataFrame({
+            hazardFields[hazard]: rng.uniform(0, 1, hazardPolygons),
+            'geometry': squares(hx, hy, hazardSize * 1.2)
+        })
+
+        def damageTable(column, values):
+            counts = rng.dirichlet([8, 4, 2, 1, 0.5], len(values)) * rng.integers(1000, 100000, len(values))[:, None]
+            return pd.DataFrame({column: values, 'Affected': counts[:, 1], 'Minor': counts[:, 2],
+                                 'Major': counts[:, 3], 'Destroyed': counts[:, 4]})
+        self._damageByOccupancy = damageTable('Occupancy', occupancies)
+        self._damageByType = damageTable('BuildingType', buildingTypes)
+
+    def frame(self, df):
+        from hazpy.legacy import StudyRegionDataFrame
+        return StudyRegionDataFrame(self, df.copy())
+
+    def getResults(self):
+        return self.frame(self._results)
+
+    def getEssentialFacilities(self):
+        return self.frame(self._facilities)
+
+    def getHazardGeoDataFrame(self):
+        return self.frame(self._hazard)
+
+    def getBuildingDamageByOccupancy(self):
+        return self.frame(self._damageByOccupancy)
+
+    def getBuildingDamageByType(self):
+        return self.frame(self._damageByType)
+
+    def getHazardsAnalyzed(self):
+        return list(self.hazards)
+
+    def getScenarios(self):
+        return [self.scenario]
+
+    def getReturnPeriods(self):
+        return [self.returnPeriod]
+
+    def setHazard(self, hazard):
+        self.hazard = hazard
+
+    def setScenario(self, scenario):
+        self.scenario = scenario
+
+    def setReturnPeriod(self, returnPeriod):
+        self.returnPeriod = returnPeriod
+
+    def getCounties(self):
+        import geopandas as gpd
+        from shapely.wkt import loads
+        counties = self.countyGeometry()
+        return gpd.GeoDataFrame(counties[['name', 'size']], geometry=[loads(x) for x in counties['geometry']])
+
+    def countyGeometry(self):
+        """ returns the county names, tract counts, and envelopes of the county tracts as WKT """
+        bounds = self._units['geometry'].str.extract(r'\(\((\S+) (\S+), (\S+) ').astype(float)
+        bounds.columns = ['x', 'y', 'x2']
+        bounds['county'] = self._units['county']
+        grouped = bounds.groupby('county').agg(x=('x', 'min'), y=('y', 'min'), x2=('x2', 'max'), y2=('y', 'max'), size=('x', 'size'))
+        counties = self._counties.set_index('county').join(grouped).reset_index()
+        counties['geometry'] = ['POLYGON (({a} {b}, {c} {b}, {c} {d}, {a} {d}, {a} {b}))'.format(a=a, b=b, c=c, d=d + 0.01)
+                                for a, b, c, d in zip(counties['x'], counties['y'], counties['x2'], counties['y2'])]
+        return counties
+
+    def getCountySummary(self):
+        """ returns the state and county rollup that draftemail.getCountySummary() queries from the database """
+        merged = self._results.merge(self._residential, on=self.unit)
+        merged['county'] = merged[self.unit].str[0:5]
+        merged = merged.merge(self._counties[['county', 'state', 'name']], on='county')
+        merged['county'] = merged['name']
+        columns = ['EconLoss', 'affected', 'minor', 'major', 'destroyed', 'DisplacedHouseholds', 'ShelterNeeds',
+                   'DebrisTotal', 'DebrisBW', 'DebrisCS', 'DebrisTree', 'DebrisEligibleTree']
+        return merged.groupby(['state', 'county'])[columns].sum().reset_index()
+
+    def query(self, sql):
+        """ answers the queries the export writers make of a study region database """
+        if 'sys.tables' in sql:
+            return pd.DataFrame({'tableName': ['synthetic'], 'rowCount': [len(self._results)]})
+        match = re.search(r'FROM\s+\[?\w+\]?\.(?:\[?dbo\]?)\.\[?(\w+)\]?', sql, re.IGNORECASE)
+        table = match.group(1).lower() if match is not None else None
+        if table in ['hztract', 'hzcensusblock']:
+            return self._units[[self.unit, 'geometry']].rename(columns={self.unit: 'tract' if table == 'hztract' else 'block'})
+        if table == 'hzcounty':
+            return self.countyGeometry()[['county', 'name', 'geometry']]
+        raise ValueError('Unsupported query for a synthetic study region (table {t}): {q}'.format(t=table, q=' '.join(sql.split())[0:200]))
@@ -0,0 +1,351 @@
+import gzip
+import json
+import math
+import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+# the tile coordinate range and the buffer drawn around every tile, in tile units
+tileExtent = 4096
+tileBuffer = 64
+# the simplification tolerance in tile units, about a quarter of a screen pixel
+simplifyTolerance = 1
+# web mercator only reaches this latitude
+maxLatitude = 85.05112878
+# features handed to a tiling task at a time
+chunkSize = 2000
+# the geometry kind encoded for every single and multipart shapely geometry type
+geometryKinds = {'Point': 'Point', 'MultiPoint': 'Point', 'LineString': 'LineString', 'LinearRing': 'LineString',
+                 'MultiLineString': 'LineString', 'Polygon': 'Polygon', 'MultiPolygon': 'Polygon'}
+
+
+def varint(value):
+    """ encodes an unsigned integer as a protobuf varint """
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def zigzag(value):
+    """ maps signed integers to unsigned ones (0, -1, 1, -2 -> 0, 1, 2, 3) """
+    return (value << 1) ^ (value >> 63)
+
+
+def fieldKey(number, wireType):
+    return varint((number << 3) | wireType)
+
+
+def lengthDelimited(number, data):
+    return fieldKey(number, 2) + varint(len(data)) + data
+
+
+def packedVarints(number, values):
+    return lengthDelimited(number, b''.join(varint(x) for x in values))
+
+
+def encodeValue(value):
+    """ encodes an attribute as a vector tile Value message, or returns None for missing values """
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, bool):
+        return fieldKey(7, 0) + varint(int(value))
+    if isinstance(value, int):
+        if value < 0:
+            return fieldKey(6, 0) + varint(zigzag(value))
+        return fieldKey(5, 0) + varint(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        return fieldKey(3, 1) + struct.pack('<d', value)
+    return lengthDelimited(1, str(value).encode('utf-8'))
+
+
+def toWorld(geometry):
+    """ projects a WGS84 geometry to web mercator world coordinates - 0 to 1 from the west and the north edge """
+    import numpy as np
+    from shapely.ops import transform
+
+    def project(x, y, z=None):
+        x = np.asarray(x, dtype=float)
+        y = np.radians(np.clip(np.asarray(y, dtype=float), -maxLatitude, maxLatitude))
+        return (x + 180.0) / 360.0, (1.0 - np.log(np.tan(y) + 1.0 / np.cos(y)) / math.pi) / 2.0
+    return transform(project, geometry)
+
+
+def quantize(coords, tileX, tileY):
+    """ returns the integer tile coordinates of a coordinate sequence, without repeated points """
+    points = []
+    for x, y in coords:
+        point = (int(round((x - tileX) * tileExtent)), int(round((y - tileY) * tileExtent)))
+        if len(points) == 0 or point != points[-1]:
+            points.append(point)
+    return points
+
+
+def singleParts(geometry):
+    """ returns the single part geometries of a geometry, flattening multipart geometries and collections """
+    if hasattr(geometry, 'geoms'):
+        return [part for x in geometry.geoms for part in singleParts(x)]
+    return [geometry]
+
+
+def geometryCommands(geometry, tileX, tileY, kind=None):
+    """ Encodes a geometry clipped to a tile as vector tile drawing commands
+
+        Polygon rings are wound as the spec requires - exterior rings with a positive area in tile
+        coordinates, interior rings with a negative area - and rings that collapse at the tile resolution
+        are dropped.
+
+        Keyword Arguments: \n
+            geometry: shapely geometry -- the clipped geometry in tile units
+            tileX: int -- the tile column
+            tileY: int -- the tile row, counted from the north edge
+            kind: str -- the geometry kind of the source feature (choices: 'Point', 'LineString', 'Polygon'); the kind of the first part if None
+        Returns:
+            encoded: tuple -- (geometry type, commands), or None if nothing is left at the tile resolution
+    """
+    commands = []
+    cursor = [0, 0]
+
+    def draw(points):
+        for x, y in points:
+            commands.extend([zigzag(x - cursor[0]), zigzag(y - cursor[1])])
+            cursor[0], cursor[1] = x, y
+
+    parts = singleParts(geometry)
+    if kind is None and len(parts) > 0:
+        kind = geometryKinds.get(parts[0].geom_type)
+    # clipping against the tile box leaves lines and points where a feature only touches the box edge
+    parts = [part for part in parts if geometryKinds.get(part.geom_type) == kind and not part.is_empty]
+    if len(parts) == 0:
+        return None
+    if kind == 'Point':
+        points = [quantize(part.coords, tileX, tileY)[0] for part in parts]
+        commands.append(1 | (len(points) << 3))
+        draw(points)
+        return 1, commands
+    if kind == 'LineString':
+        for part in parts:
+            points = quantize(part.coords, tileX, tileY)
+            if len(points) < 2:
+                continue
+            commands.append(1 | (1 << 3))
+            draw(points[0:1])
+            commands.append(2 | ((len(points) - 1) << 3))
+            draw(points[1:])
+        return (2, commands) if len(commands) > 0 else None
+    if kind == 'Polygon':
+        for part in parts:
+            for index, ring in enumerate([part.exterior] + list(part.interiors)):
+                points = quantize(ring.coords, tileX, tileY)
+                if len(points) > 1 and points[0] == points[-1]:
+                    points = points[0:-1]
+                area = sum(points[i][0] * points[i - 1][1] - points[i - 1][0] * points[i][1] for i in range(len(points)))
+                if len(points) < 3 or area == 0:
+                    if index == 0:
+                        # the holes of a collapsed polygon are dropped with it
+                        break
+                    continue
+                if (index == 0) != (area < 0):
+                    points.reverse()
+                commands.append(1 | (1 << 3))
+                draw(points[0:1])
+                commands.append(2 | ((len(points) - 1) << 3))
+                draw(points[1:])
+                commands.append(7 | (1 << 3))
+        return (3, commands) if len(commands) > 0 else None
+    return None
+
+
+def tileFeatures(features, zoom):
+    """ Cuts features into the tiles of a zoom level
+
+        Keyword Arguments: \n
+            features: list -- (id, world geometry, properties) tuples
+            zoom: int -- the zoom level
+        Returns:
+            tiles: dict -- (x, y) -> list of (id, geometry type, commands, properties)
+    """
+    from shapely.affinity import scale as scaleGeometry
+    from shapely.geometry import box
+
+    tiles = {}
+    count = 2 ** zoom
+    margin = tileBuffer / float(tileExtent)
+    for featureId, geometry, properties in features:
+        scaled = scaleGeometry(geometry, count, count, origin=(0, 0))
+        if scaled.geom_type not in ['Point', 'MultiPoint']:
+            scaled = scaled.simplify(simplifyTolerance / float(tileExtent), preserve_topology=True)
+        if scaled.is_empty:
+            continue
+        kind = geometryKinds.get(scaled.geom_type)
+        minX, minY, maxX, maxY = scaled.bounds
+        for tileX in range(max(0, int(math.floor(minX - margin))), min(count - 1, int(math.floor(maxX + margin))) + 1):
+            for tileY in range(max(0, int(math.floor(minY - margin))), min(count - 1, int(math.floor(maxY + margin))) + 1):
+                if scaled.geom_type in ['Point', 'MultiPoint']:
+                    part = scaled.intersection(box(tileX, tileY, tileX + 1, tileY + 1))
+                elif tileX - margin <= minX and maxX <= tileX + 1 + margin and tileY - margin <= minY and maxY <= tileY + 1 + margin:
+                    part = scaled
+                else:
+                    part = scaled.intersection(box(tileX - margin, tileY - margin, tileX + 1 + margin, tileY + 1 + margin))
+                if part.is_empty:
+                    continue
+                encoded = geometryCommands(part, tileX, tileY, kind)
+                if encoded is not None:
+                    tiles.setdefault((tileX, tileY), []).append((featureId, encoded[0], encoded[1], properties))
+    return tiles
+
+
+def encodeTile(layers):
+    """ Encodes the layers of a tile as a gzipped vector tile
+
+        Keyword Arguments: \n
+            layers: list -- (layer name, features) tuples, see tileFeatures()
+    """
+    tile = b''
+    for name, features in layers:
+        keys = {}
+        values = {}
+        encodedFeatures = []
+        for featureId, geometryType, commands, properties in features:
+            tags = []
+            for key, value in properties.items():
+                encodedValue = encodeValue(value)
+                if encodedValue is None:
+                    continue
+                tags.append(keys.setdefault(key, len(keys)))
+                tags.append(values.setdefault(encodedValue, len(values)))
+            feature = fieldKey(1, 0) + varint(featureId)
+            if len(tags) > 0:
+                feature += packedVarints(2, tags)
+            feature += fieldKey(3, 0) + varint(geometryType) + packedVarints(4, commands)
+            encodedFeatures.append(lengthDelimited(2, feature))
+        layer = fieldKey(15, 0) + varint(2) + lengthDelimited(1, name.encode('utf-8')) + b''.join(encodedFeatures) + \
+            b''.join(lengthDelimited(3, str(key).encode('utf-8')) for key in keys) + \
+            b''.join(lengthDelimited(4, value) for value in values) + fieldKey(5, 0) + varint(tileExtent)
+        tile += lengthDelimited(3, layer)
+    return gzip.compress(tile)
+
+
+def prepareLayer(df, summaryAttributes):
+    """ Returns the features of a frame in world coordinates with their full and summary attributes
+
+        Returns:
+            features: list -- (id, world geometry, properties, summary properties) tuples
+            fields: dict -- the vector_layers field types of the attributes
+            bounds: tuple -- the WGS84 bounds of the layer, or None if it has no geometry
+    """
+    from shapely.wkt import loads
+
+    columns = [x for x in df.columns if x != 'geometry']
+    fields = {str(x): 'Number' if df[x].dtype.kind in 'biuf' else 'String' for x in columns}
+    records = df[columns].to_dict('records')
+    features = []
+    bounds = None
+    for index, (geometry, properties) in enumerate(zip(df['geometry'], records)):
+        if geometry is None or str(geometry) in ['', 'nan', 'None']:
+            continue
+        geometry = geometry if hasattr(geometry, 'wkb') else loads(str(geometry))
+        if geometry.is_empty:
+            continue
+        minX, minY, maxX, maxY = geometry.bounds
+        bounds = (minX, minY, maxX, maxY) if bounds is None else \
+            (min(bounds[0], minX), min(bounds[1], minY), max(bounds[2], maxX), max(bounds[3], maxY))
+        properties = {str(key): value for key, value in properties.items()}
+        summary = {key: value for key, value in properties.items() if key in summaryAttributes}
+        features.append((index + 1, toWorld(geometry), properties, summary))
+    return features, fields, bounds
+
+
+def writeVectorTiles(layers, path, minZoom=4, maxZoom=12, detailZoom=10, summaryAttributes=None, workers=4, progress=None):
+    """ Writes layers as a zoom-pyramided vector tile archive (MBTiles with gzipped Mapbox Vector Tiles)
+
+        Every zoom level is cut on a pool of threads, a chunk of features of a layer per task, and the
+        tiles of the level are encoded on the pool and inserted before the next level is cut. Below the
+        detail zoom the features carry only their summary attributes, which keeps the zoomed out tiles
+        small. The archive is built next to the output path and moved into place once complete.
+
+        Keyword Arguments: \n
+            layers: list -- (layer name, dataframe) tuples; the frames need a WKT or shapely geometry column in WGS84
+            path: str -- the output path (example: 'C:/directory/export.mbtiles')
+            minZoom: int -- the lowest zoom level
+            maxZoom: int -- the highest zoom level
+            detailZoom: int -- the lowest zoom level with every attribute
+            summaryAttributes: dict -- layer name -> the attributes kept below the detail zoom; layers not listed keep none
+            workers: int -- the number of threads cutting and encoding tiles
+            progress: function -- optional progress(levels, totalLevels) called after every zoom level
+    """
+    summaryAttributes = summaryAttributes or {}
+    prepared = []
+    vectorLayers = []
+    bounds = None
+    for name, df in layers:
+        features, fields, layerBounds = prepareLayer(df, set(summaryAttributes.get(name, [])))
+        prepared.append((name, features))
+        vectorLayers.append({'id': name, 'fields': fields, 'minzoom': minZoom, 'maxzoom': maxZoom})
+        if layerBounds is not None:
+            bounds = layerBounds if bounds is None else \
+                (min(bounds[0], layerBounds[0]), min(bounds[1], layerBounds[1]), max(bounds[2], layerBounds[2]), max(bounds[3], layerBounds[3]))
+    bounds = bounds or (-180.0, -maxLatitude, 180.0, maxLatitude)
+
+    temporaryPath = path + '.tmp'
+    if os.path.exists(temporaryPath):
+        os.remove(temporaryPath)
+    conn = sqlite3.connect(temporaryPath, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('BEGIN')
+        conn.execute('CREATE TABLE metadata (name TEXT, value TEXT)')
+        conn.execute('CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)')
+        metadata = {
+            'name': os.path.splitext(os.path.basename(path))[0],
+            'format': 'pbf',
+            'type': 'overlay',
+            'minzoom': str(minZoom),
+            'maxzoom': str(maxZoom),
+            'bounds': ','.join(str(x) for x in bounds),
+            'center': '{x},{y},{z}'.format(x=(bounds[0] + bounds[2]) / 2.0, y=(bounds[1] + bounds[3]) / 2.0, z=minZoom),
+            'json': json.dumps({'vector_layers': vectorLayers})
+        }
+        conn.executemany('INSERT INTO metadata VALUES (?, ?)', list(metadata.items()))
+
+        with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='VectorTiles') as executor:
+            for level, zoom in enumerate(range(minZoom, maxZoom + 1), 1):
+                tasks = []
+                for name, features in prepared:
+                    levelFeatures = [(featureId, geometry, properties if zoom >= detailZoom else summary)
+                                     for featureId, geometry, properties, summary in features]
+                    for start in range(0, len(levelFeatures), chunkSize):
+                        tasks.append((name, executor.submit(tileFeatures, levelFeatures[start:start + chunkSize], zoom)))
+                # (x, y) -> layer name -> features, in layer order
+                tiles = {}
+                for name, task in tasks:
+                    for tile, features in task.result().items():
+                        tiles.setdefault(tile, {}).setdefault(name, []).extend(features)
+                layerNames = [name for name, _ in prepared]
+                encoded = executor.map(lambda item: (item[0], encodeTile([(x, item[1][x]) for x in layerNames if x in item[1]])),
+                                       list(tiles.items()))
+                rowCount = 2 ** zoom
+                conn.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                                 ((zoom, tileX, rowCount - 1 - tileY, data) for (tileX, tileY), data in encoded))
+                if progress is not None:
+                    progress(level, maxZoom - minZoom + 1)
+        conn.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        conn.execute('COMMIT')
+    except:
+        conn.close()
+        os.remove(temporaryPath)
+        raise
+    conn.close()
+    os.replace(temporaryPath, path)
@@ -0,0 +1,104 @@
+import requests
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from time import time
+from urllib.parse import urlparse
+
+
+class Connectivity():
+    """ Finds how this machine reaches the internet - directly or through the FEMA proxy - once per session
+
+        The direct route and the proxy are probed at the same time, each with its own timeout, and the
+        route is remembered for the time to live, so the callers that need the network share one probe
+        instead of connecting and timing out one after the other. A direct connection is preferred when
+        both routes work. Every HTTP request goes through one requests session configured for the route,
+        which keeps its connections open between requests.
+
+        Keyword Arguments: \n
+            proxy: str -- the proxy url (example: 'http://proxy.apps.dhs.gov:80')
+            timeout: int -- seconds each probe waits for a connection
+            ttl: int -- seconds the route is remembered
+            directHost: str -- the host probed for a direct connection
+            directPort: int -- the port probed for a direct connection
+    """
+
+    def __init__(self, proxy, timeout=5, ttl=600, directHost='google.com', directPort=80):
+        self.proxy = proxy
+        self.timeout = timeout
+        self.ttl = ttl
+        self.direct = (directHost, directPort)
+        proxyUrl = urlparse(proxy)
+        self.proxied = (proxyUrl.hostname, proxyUrl.port or 80)
+        self._route = None
+        self._resolved = None
+        self._session = None
+        self._sessionRoute = None
+        self._lock = threading.Lock()
+
+    def probe(self, address):
+        """ returns True if a TCP connection to the (host, port) address opens within the timeout """
+        try:
+            connection = socket.create_connection(address, timeout=self.timeout)
+            connection.close()
+            return True
+        except:
+            return False
+
+    def resolve(self):
+        """ probes both routes at the same time - a working direct route is returned as soon as it connects """
+        executor = ThreadPoolExecutor(max_workers=2)
+        futures = {executor.submit(self.probe, self.direct): 'direct', executor.submit(self.probe, self.proxied): 'proxy'}
+        working = set()
+        pending = set(futures)
+        try:
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                working.update(futures[x] for x in done if x.result())
+                if 'direct' in working:
+                    return 'direct'
+        finally:
+            # a probe still running ends within its own timeout
+            executor.shutdown(wait=False)
+        return 'proxy' if 'proxy' in working else None
+
+    def route(self):
+        """ Returns the remembered route, probing the routes if it has expired
+
+            Returns:
+                route: str -- 'direct', 'proxy', or None if neither connects
+        """
+        with self._lock:
+            if self._resolved is None or time() - self._resolved > self.ttl:
+                self._route = self.resolve()
+                self._resolved = time()
+            return self._route
+
+    def invalidate(self):
+        """ forgets the route, so the next request probes again (example: after the network changed) """
+        with self._lock:
+            self._resolved = None
+
+    def proxies(self):
+        """ returns the requests proxies of the route """
+        if self.route() == 'proxy':
+            return {'http': self.proxy, 'https': self.proxy}
+        return {}
+
+    def session(self):
+        """ returns the shared requests session, configured for the current route """
+        proxies = self.proxies()
+        with self._lock:
+            if self._session is None or self._sessionRoute != self._route:
+                if self._session is not None:
+                    self._session.close()
+                self._session = requests.Session()
+                self._session.proxies.update(proxies)
+                self._sessionRoute = self._route
+            return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -2,10 +2,14 @@ from subprocess import check_output, check_call, call, Popen
 import os
 import ctypes
 import sys
-import requests
 import pkg_resources
 import json
-import socket
+try:
+    from src.connectivity import Connectivity
+    from src.updatecheck import UpdateCheck
+except:
+    from connectivity import Connectivity
+    from updatecheck import UpdateCheck
 
 
 class Manage:
@@ -32,6 +36,14 @@ class Manage:
         self.python_package = self.config[self.release]['pythonPackage']
         self.virtual_environment = self.config[self.release]['virtualEnvironment']
         self.http_timeout = self.config[self.release]['httpTimeout']  # in seconds
+        # the route to the internet is probed once and every request shares one session
+        connectivityConfig = self.config['connectivity']
+        self.connectivity = Connectivity(self.proxy, self.http_timeout, connectivityConfig['ttl'],
+                                         connectivityConfig['directHost'], connectivityConfig['directPort'])
+        # the newest versions are fetched at most once per time to live
+        updateConfig = self.config['updates']
+        self.updateCheck = UpdateCheck(self.getUrl, self.parseVersionFromInit, updateConfig['stateFile'],
+                                       updateConfig['ttl'], updateConfig['failureTtl'])
 
         self.conda_activate, self.conda_deactivate = self.getCondaActivateDeactivate()
         # init message dialog box
@@ -125,20 +137,33 @@ class Manage:
                     u" was not installed. Please check your network settings and try again.", u"HazPy", 0x1000 | 0x4)
 
 
+    def checkForUpdates(self):
+        """ checks for tool and hazpy updates - the newest versions are fetched at the same time, then each update is offered in turn
+        """
+        urls = [self.tool_version_url]
+        if self.isCondaInPath():
+            urls.append(self.hazpy_version_url)
+        self.updateCheck.refresh(urls)
+        self.checkForToolUpdates()
+        self.checkForHazPyUpdates()
+
+
+    def getUrl(self, url):
+        """ GET request through the shared session, which uses the FEMA proxy when it is needed
+        """
+        if self.handleProxy() == -1:
+            # offline - the probes already waited for the timeout
+            raise ConnectionError('No internet connection')
+        return self.connectivity.session().get(url, timeout=self.http_timeout)
+
+
     def checkForHazPyUpdates(self):
         print('Checking for HazPy updates')
         if self.isCondaInPath(): # only create if conda in PATH
             try:
                 installedVersion = pkg_resources.get_distribution(self.python_package).version
-                try:
-                    self.handleProxy()
-                    req = requests.get(self.hazpy_version_url, timeout=self.http_timeout)
-                except:
-                    self.removeProxy()
-                    req = requests.get(self.hazpy_version_url, timeout=self.http_timeout)
-                status = req.status_code
-                if status == 200:
-                    newestVersion = self.parseVersionFromInit(req.text)
+                newestVersion = self.updateCheck.latestVersion(self.hazpy_version_url)
+                if newestVersion is not None:
                     if newestVersion != installedVersion:
                         returnValue = self.messageBox(None, u"A new version of the " + self.python_package +
                                                 u" python package was found. Would you like to install it now?", u"HazPy", 0x1000 | 0x4)
@@ -161,16 +186,9 @@ class Manage:
                 text = init.readlines()
                 textBlob = ''.join(text)
                 installedVersion = self.parseVersionFromInit(textBlob)
-            try:
-                self.handleProxy()
-                req = requests.get(self.tool_version_url, timeout=self.http_timeout)
-            except:
-                self.removeProxy()
-                req = requests.get(self.tool_version_url, timeout=self.http_timeout)
-            status = req.status_code
+            newestVersion = self.updateCheck.latestVersion(self.tool_version_url)
 
-            if status == 200:
-                newestVersion = self.parseVersionFromInit(req.text)
+            if newestVersion is not None:
                 if newestVersion != installedVersion:
                     returnValue = self.messageBox(
                         None, u"A new version of the tool was found. Would you like to install it now?", u"HazPy", 0x1000 | 0x4)
@@ -193,8 +211,9 @@ class Manage:
             from io import BytesIO
             from zipfile import ZipFile
 
-            self.handleProxy()
-            r = requests.get(self.tool_zipfile_url)
+            # the timeout bounds every connect and read, so a stalled proxy cannot hang the update
+            r = self.getUrl(self.tool_zipfile_url)
+            r.raise_for_status()
 
             z = ZipFile(BytesIO(r.content))
             z.extractall()
@@ -228,28 +247,21 @@ class Manage:
 
 
     def handleProxy(self):
-        try:
-            socket.setdefaulttimeout(self.http_timeout)
-            port = 80
-            try:
-                # try without the proxy
-                host = 'google.com'    # The remote host
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.connect((host, port))
-                s.close()
-                return False
-            except:
-                # try with the fema proxy
-                host = "proxy.apps.dhs.gov"  # proxy server IP
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.connect((host, port))
-                s.close()
-                self.setProxies()
-                return True
-        except:
-            # 0 indicates there is no internet connection
-            # or the method was unable to connect using the hosts and ports
-            return -1
+        """ Sets the proxy environmental variables if the internet is reached through the FEMA proxy
+
+        Returns:
+            proxied: bool -- True if the proxy is used, False for a direct connection, -1 if neither connects
+        """
+        route = self.connectivity.route()
+        if route == 'direct':
+            return False
+        if route == 'proxy':
+            # conda and the other subprocesses read the proxy from the environment
+            self.setProxies()
+            return True
+        # -1 indicates there is no internet connection
+        # or the method was unable to connect using the hosts and ports
+        return -1
 
     def removeProxy(self):
         os.environ['HTTP_PROXY'] = ''
@@ -5,8 +5,7 @@ try:
     except:
         from manage import Manage
         manage = Manage()
-    manage.checkForToolUpdates()
-    manage.checkForHazPyUpdates()
+    manage.checkForUpdates()
 except Exception as e:
     import ctypes
     import sys
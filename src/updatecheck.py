@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+
+class UpdateCheck():
+    """ Looks up the newest published versions of the tool and hazpy, cached in a local state file
+
+        Every version url is fetched at most once per time to live; a failed fetch (offline, blocked by a
+        proxy, not found) is remembered for the shorter failure time to live, so a machine without a
+        connection does not wait for the timeouts on every launch. The urls that are not cached are
+        fetched at the same time.
+
+        Keyword Arguments: \n
+            fetch: function -- fetch(url) returns the response of a GET request (example: requests.get)
+            parseVersion: function -- parseVersion(text) returns the version of an __init__.py
+            stateFile: str -- the JSON file of the cached versions; kept in memory only if None
+            ttl: int -- seconds a fetched version is reused
+            failureTtl: int -- seconds a failed fetch is remembered before the url is fetched again
+    """
+
+    def __init__(self, fetch, parseVersion, stateFile=None, ttl=86400, failureTtl=3600):
+        self.fetch = fetch
+        self.parseVersion = parseVersion
+        self.stateFile = stateFile
+        self.ttl = ttl
+        self.failureTtl = failureTtl
+        self._lock = threading.Lock()
+        self.state = self.readState()
+
+    def readState(self):
+        if self.stateFile is None or not os.path.exists(self.stateFile):
+            return {}
+        try:
+            with open(self.stateFile) as stateFile:
+                return json.load(stateFile)
+        except:
+            print('Unable to read the update check state: ' + str(sys.exc_info()[0]))
+            return {}
+
+    def saveState(self):
+        if self.stateFile is None:
+            return
+        try:
+            with self._lock:
+                state = dict(self.state)
+            if os.path.dirname(self.stateFile) != '':
+                os.makedirs(os.path.dirname(self.stateFile), exist_ok=True)
+            with open(self.stateFile + '.tmp', 'w') as stateFile:
+                json.dump(state, stateFile, indent=2)
+            os.replace(self.stateFile + '.tmp', self.stateFile)
+        except:
+            print('Unable to save the update check state: ' + str(sys.exc_info()[0]))
+
+    def cached(self, url):
+        """ returns the cached entry of a url - {'version', 'checked'} - or None if it is missing or expired """
+        with self._lock:
+            entry = self.state.get(url)
+        if entry is None:
+            return None
+        ttl = self.ttl if entry.get('version') is not None else self.failureTtl
+        if time() - entry.get('checked', 0) > ttl:
+            return None
+        return entry
+
+    def check(self, url):
+        """ fetches the version published at a url and caches it, or caches the failure """
+        version = None
+        try:
+            response = self.fetch(url)
+            if response.status_code == 200:
+                version = self.parseVersion(response.text)
+        except:
+            print('Unable to connect to the url: ' + url)
+        entry = {'version': version, 'checked': time()}
+        with self._lock:
+            self.state[url] = entry
+        return entry
+
+    def refresh(self, urls):
+        """ fetches the urls that are not cached at the same time and saves the state """
+        stale = [url for url in urls if self.cached(url) is None]
+        if len(stale) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+            list(executor.map(self.check, stale))
+        self.saveState()
+
+    def latestVersion(self, url):
+        """ Returns the newest version published at a url
+
+            Returns:
+                version: str -- the version, or None if the url could not be read within the failure time to live
+        """
+        entry = self.cached(url)
+        if entry is None:
+            entry = self.check(url)
+            self.saveState()
+        return entry['version']
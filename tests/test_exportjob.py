@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Python_env'))
+
+from exportjob import ExportJob
+
+
+class QueryCountingStudyRegion():
+    """ a study region that records its database queries and has no data """
+
+    def __init__(self):
+        self.name = 'email_only'
+        self.hazard = 'hurricane'
+        self.scenario = 'scenario'
+        self.returnPeriod = '100'
+        self.queries = []
+
+    def query(self, sql):
+        self.queries.append(sql)
+        raise ValueError('No database')
+
+
+class TestEmailOnlyExport(unittest.TestCase):
+
+    def setUp(self):
+        self.workingDirectory = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.workingDirectory)
+
+    def test_incremental_email_only_export_writes_no_manifest(self):
+        studyRegion = QueryCountingStudyRegion()
+        job = ExportJob(studyRegion, '', {'draftEmail': 1}, incremental=True)
+        job.run()
+        self.assertIsNone(job.manifest)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual([x for x in studyRegion.queries if 'sys.tables' in x], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
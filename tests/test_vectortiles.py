@@ -0,0 +1,187 @@
+import gzip
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Python_env'))
+
+import pandas as pd
+from shapely.geometry import GeometryCollection, LineString, box
+from shapely.ops import unary_union
+
+from vectortiles import encodeTile, geometryCommands, tileBuffer, tileExtent, tileFeatures, writeVectorTiles
+
+
+def readVarint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, offset
+
+
+def readMessage(data):
+    """ returns the fields of a protobuf message as (field number, value) tuples """
+    fields = []
+    offset = 0
+    while offset < len(data):
+        key, offset = readVarint(data, offset)
+        number, wireType = key >> 3, key & 7
+        if wireType == 0:
+            value, offset = readVarint(data, offset)
+        elif wireType == 1:
+            value = data[offset:offset + 8]
+            offset += 8
+        elif wireType == 2:
+            length, offset = readVarint(data, offset)
+            value = data[offset:offset + length]
+            offset += length
+        else:
+            raise ValueError('Unexpected wire type ' + str(wireType))
+        fields.append((number, value))
+    return fields
+
+
+def readPacked(data):
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = readVarint(data, offset)
+        values.append(value)
+    return values
+
+
+def decodeTile(data):
+    """ decodes a gzipped vector tile to {layer name: {'version', 'extent', 'keys', 'features'}} """
+    layers = {}
+    for number, layerData in readMessage(gzip.decompress(data)):
+        if number != 3:
+            continue
+        layer = {'keys': [], 'features': []}
+        for field, value in readMessage(layerData):
+            if field == 1:
+                name = value.decode('utf-8')
+            elif field == 2:
+                feature = dict(readMessage(value))
+                layer['features'].append({'id': feature[1], 'type': feature[3], 'commands': readPacked(feature[4]),
+                                          'tags': readPacked(feature.get(2, b''))})
+            elif field == 3:
+                layer['keys'].append(value.decode('utf-8'))
+            elif field == 5:
+                layer['extent'] = value
+            elif field == 15:
+                layer['version'] = value
+        layers[name] = layer
+    return layers
+
+
+def polygonRings(commands):
+    """ decodes polygon drawing commands to rings of absolute tile coordinates """
+    rings = []
+    x, y = 0, 0
+    index = 0
+    while index < len(commands):
+        command, count = commands[index] & 7, commands[index] >> 3
+        index += 1
+        if command == 7:
+            continue
+        if command == 1:
+            rings.append([])
+        for _ in range(count):
+            dx, dy = commands[index], commands[index + 1]
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            rings[-1].append((x, y))
+            index += 2
+    return rings
+
+
+def ringArea(ring):
+    """ the shoelace area - positive for the exterior rings the spec requires, with y pointing down """
+    return sum(ring[i - 1][0] * ring[i][1] - ring[i][0] * ring[i - 1][1] for i in range(len(ring))) / 2.0
+
+
+class TestGeometryCommands(unittest.TestCase):
+
+    def test_mixed_collection_is_filtered_to_the_source_kind(self):
+        # a line where the polygon touched the tile box edge, listed before the polygon itself
+        clipped = GeometryCollection([LineString([(0.0, 0.5), (0.0, 0.6)]), box(0.25, 0.25, 0.5, 0.5)])
+        geometryType, commands = geometryCommands(clipped, 0, 0, 'Polygon')
+        self.assertEqual(geometryType, 3)
+        self.assertEqual(commands, [9, 4096, 2048, 26, 0, 2048, 2047, 0, 0, 2047, 15])
+        self.assertEqual(polygonRings(commands), [[(2048, 1024), (2048, 2048), (1024, 2048), (1024, 1024)]])
+
+    def test_collection_without_the_source_kind_is_dropped(self):
+        self.assertIsNone(geometryCommands(GeometryCollection([LineString([(0.0, 0.5), (0.0, 0.6)])]), 0, 0, 'Polygon'))
+
+    def test_rings_are_wound_as_the_spec_requires(self):
+        polygon = box(0.1, 0.1, 0.9, 0.9).difference(box(0.4, 0.4, 0.6, 0.6))
+        exterior, interior = polygonRings(geometryCommands(polygon, 0, 0)[1])
+        self.assertGreater(ringArea(exterior), 0)
+        self.assertLess(ringArea(interior), 0)
+
+
+class TestTileFeatures(unittest.TestCase):
+
+    def test_polygon_touching_the_buffer_edge_is_encoded_as_a_polygon(self):
+        # a C shaped polygon at zoom 1 whose left arm lies against the buffered box of tile (1, 0) from the outside,
+        # so clipping it to that box gives a collection of a polygon and a line
+        margin = tileBuffer / float(tileExtent)
+        scaled = unary_union([box(1.5, 0.2, 1.7, 1.5), box(0.5, 1.3, 1.7, 1.5), box(0.5, 0.5, 1 - margin, 1.5)])
+        clipped = scaled.intersection(box(1 - margin, -margin, 2 + margin, 1 + margin))
+        self.assertEqual(sorted(x.geom_type for x in clipped.geoms), ['LineString', 'Polygon'])
+
+        world = unary_union([box(0.75, 0.1, 0.85, 0.75), box(0.25, 0.65, 0.85, 0.75), box(0.25, 0.25, (1 - margin) / 2.0, 0.75)])
+        tiles = tileFeatures([(1, world, {'name': 'hazard'})], 1)
+        layers = decodeTile(encodeTile([('hazard', tiles[(1, 0)])]))
+        feature = layers['hazard']['features'][0]
+        self.assertEqual(layers['hazard']['version'], 2)
+        self.assertEqual(layers['hazard']['extent'], tileExtent)
+        self.assertEqual(layers['hazard']['keys'], ['name'])
+        self.assertEqual(feature['type'], 3)
+        rings = polygonRings(feature['commands'])
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(sorted(rings[0]), [(2048, 819), (2048, 4160), (2867, 819), (2867, 4160)])
+        self.assertGreater(ringArea(rings[0]), 0)
+
+
+class TestWriteVectorTiles(unittest.TestCase):
+
+    def test_tiles_are_stored_with_the_tms_row(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'export.mbtiles')
+        # at zoom 2 the polygon is in the tile at column 2 and row 1 counted from the north edge
+        df = pd.DataFrame({'tract': ['01001020100'], 'EconLoss': [12.5],
+                           'geometry': ['POLYGON ((10 10, 11 10, 11 11, 10 11, 10 10))']})
+        writeVectorTiles([('results', df)], path, minZoom=2, maxZoom=2, detailZoom=2, workers=1)
+
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles').fetchall()
+            metadata = dict(conn.execute('SELECT name, value FROM metadata').fetchall())
+        finally:
+            conn.close()
+        self.assertEqual([x[0:3] for x in rows], [(2, 2, 2)])
+        self.assertEqual(metadata['format'], 'pbf')
+
+        layers = decodeTile(rows[0][3])
+        feature = layers['results']['features'][0]
+        self.assertEqual(feature['id'], 1)
+        self.assertEqual(feature['type'], 3)
+        self.assertEqual(layers['results']['keys'], ['tract', 'EconLoss'])
+        rings = polygonRings(feature['commands'])
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(len(rings[0]), 4)
+        self.assertGreater(ringArea(rings[0]), 0)
+        # the polygon is in the south west quarter of its tile
+        self.assertTrue(all(0 <= x < 2048 and 2048 <= y < tileExtent for x, y in rings[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()